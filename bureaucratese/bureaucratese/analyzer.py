@@ -1,7 +1,35 @@
 import os
 import pandas as pd
-import jieba
 from pathlib import Path
+from .dictionary import load_dictionary, get_tokenizer
+from .matcher import OfficialWordMatcher, DEFAULT_CHARS_PER_WORD
+from .profiling import stage
+
+
+class SegmentationResult:
+    """单个文本的分词结果
+
+    分词是非BERT模式中最耗时的步骤，基础密度、加权密度和官方话语列表
+    都从同一个分词结果计算，避免对同一文本重复分词。
+
+    Attributes:
+        words (list): 去除空白后的分词列表
+        official_words (list): 分词结果中属于官方话语的词，保持原文顺序
+    """
+    __slots__ = ('words', 'official_words')
+
+    def __init__(self, words, official_words):
+        self.words = words
+        self.official_words = official_words
+
+    @property
+    def total_words(self):
+        return len(self.words)
+
+    @property
+    def official_word_count(self):
+        return len(self.official_words)
+
 
 class BureaucrateseAnalyzer:
     def __init__(self, custom_dict_path=None, use_bert=False):
@@ -9,40 +37,57 @@ class BureaucrateseAnalyzer:
         self.word_types = {}
         self.word_frequencies = {}
         self.use_bert = use_bert
+        self.custom_dict_path = custom_dict_path
+        # 快速模式估计总词数时每个未匹配汉字词的平均字数，可用calibrate_fast_mode拟合
+        self.fast_chars_per_word = DEFAULT_CHARS_PER_WORD
+        self._matcher = None
+        # 本实例专用的剖析钩子，对所有线程生效；共享的实例应使用profiling.attach
+        self.profiler = None
         self._load_dictionary(custom_dict_path)
         
         if self.use_bert:
-            from .bert_analyzer import BertBureaucrateseAnalyzer
-            self.bert_analyzer = BertBureaucrateseAnalyzer()
+            from .registry import get_bert_analyzer
+            self.bert_analyzer = get_bert_analyzer(custom_dict_path=custom_dict_path)
 
     def _load_dictionary(self, custom_dict_path=None):
-        if custom_dict_path is None:
-            # 使用默认的词典文件
-            package_dir = Path(__file__).parent
-            custom_dict_path = package_dir / '../data/RAWdataset.csv'
-
-        df = pd.read_csv(custom_dict_path)
+        # 加载编译后的词典，CSV修改后会自动重新编译
+        self.dictionary = load_dictionary(custom_dict_path)
         # 只保留官方话语的词
-        official_words_df = df[df['typeOfWord'] == '官方话语']
-        self.official_words = set(official_words_df['Word'].tolist())
+        self.official_words = self.dictionary.official_words
         
-        # 保存词语类型信息
-        self.word_types = dict(zip(df['Word'], df['typeOfWord']))
+        # 保存词语类型和词频信息
+        self.word_types = self.dictionary.word_types
+        self.word_frequencies = self.dictionary.word_frequencies
         
-        # 将词典添加到jieba分词器中
-        for word in df['Word']:
-            jieba.add_word(word)
-        
-        # 将词典添加到jieba分词器中，并设置词频权重
-        for word, freq in zip(df['Word'], df['Frequency']):
-            jieba.add_word(word, freq=freq)
-        
-        # 保存词频信息
-        self.word_frequencies = dict(zip(df['Word'], df['Frequency']))
+        # 使用该词典独立的分词器，不修改jieba的全局词典
+        self.tokenizer = get_tokenizer(self.dictionary)
+
+    def segment(self, text):
+        """对文本进行一次分词，返回可供多种分析方法共用的分词结果
+
+        Args:
+            text (str): 要分词的文本
+
+        Returns:
+            SegmentationResult: 分词结果
+        """
+        if not text.strip():
+            return SegmentationResult([], [])
+
+        # 使用结巴分词
+        with stage(self, 'segmentation'):
+            words = [word for word in self.tokenizer.cut(text) if word.strip()]
+        with stage(self, 'lookup'):
+            official_words_found = [word for word in words if word in self.official_words]
+        return SegmentationResult(words, official_words_found)
 
     def analyze_text(self, text):
         """分析文本中的官方话语密度"""
-        if not text.strip():
+        return self._analyze_segmentation(self.segment(text))
+
+    def _analyze_segmentation(self, segmentation):
+        """根据分词结果计算基础密度"""
+        if not segmentation.words:
             return {
                 'density': 0.0,
                 'official_words': [],
@@ -50,20 +95,15 @@ class BureaucrateseAnalyzer:
                 'official_word_count': 0
             }
 
-        # 使用结巴分词
-        words = [word for word in jieba.cut(text) if word.strip()]
-        total_words = len(words)
-        
-        # 统计官方话语词汇
-        official_words_found = [word for word in words if word in self.official_words]
-        official_word_count = len(official_words_found)
+        total_words = segmentation.total_words
+        official_word_count = segmentation.official_word_count
         
         # 计算密度
         density = official_word_count / total_words if total_words > 0 else 0
         
         return {
             'density': density,
-            'official_words': official_words_found,
+            'official_words': list(segmentation.official_words),
             'total_words': total_words,
             'official_word_count': official_word_count
         }
@@ -74,7 +114,11 @@ class BureaucrateseAnalyzer:
 
     def analyze_text_weighted(self, text):
         """使用词频权重分析文本中的官方话语浓度"""
-        if not text.strip():
+        return self._analyze_segmentation_weighted(self.segment(text))
+
+    def _analyze_segmentation_weighted(self, segmentation):
+        """根据分词结果计算加权浓度"""
+        if not segmentation.words:
             return {
                 'weighted_density': 0.0,
                 'official_words': [],
@@ -82,13 +126,8 @@ class BureaucrateseAnalyzer:
                 'official_word_count': 0
             }
 
-        # 使用结巴分词
-        words = [word for word in jieba.cut(text) if word.strip()]
-        total_words = len(words)
-        
-        # 统计官方话语词汇及其权重
-        official_words_found = [word for word in words if word in self.official_words]
-        official_word_count = len(official_words_found)
+        words = segmentation.words
+        official_words_found = segmentation.official_words
         
         # 计算加权浓度
         total_frequency = sum(self.word_frequencies.get(word, 1) for word in words)
@@ -98,11 +137,94 @@ class BureaucrateseAnalyzer:
         
         return {
             'weighted_density': weighted_density,
+            'official_words': list(official_words_found),
+            'total_words': segmentation.total_words,
+            'official_word_count': segmentation.official_word_count
+        }
+
+    def _get_matcher(self):
+        """获取官方话语匹配器，首次使用时构建"""
+        if self._matcher is None:
+            self._matcher = OfficialWordMatcher(self.official_words, chars_per_word=self.fast_chars_per_word)
+        self._matcher.chars_per_word = self.fast_chars_per_word
+        return self._matcher
+
+    def analyze_text_fast(self, text):
+        """不分词的快速模式分析官方话语密度
+
+        用前缀树匹配统计官方话语出现次数，按字符类别估计总词数，
+        速度远高于基于分词的基础模式，结果为近似值。
+        """
+        if not text.strip():
+            return {
+                'density': 0.0,
+                'official_words': [],
+                'total_words': 0,
+                'official_word_count': 0
+            }
+
+        matcher = self._get_matcher()
+        with stage(self, 'fast_match'):
+            official_words_found = matcher.find(text)
+            official_word_count = len(official_words_found)
+            total_words = matcher.estimate_total_words(text, official_words_found)
+        
+        density = official_word_count / total_words if total_words > 0 else 0
+        
+        return {
+            'density': density,
             'official_words': official_words_found,
             'total_words': total_words,
             'official_word_count': official_word_count
         }
 
+    def calibrate_fast_mode(self, texts, apply=False):
+        """在样本语料上比较快速模式与基础模式的密度
+
+        Args:
+            texts (iterable): 样本文本
+            apply (bool): 是否将拟合出的平均字数应用到快速模式
+
+        Returns:
+            dict: 校准报告
+        """
+        from .matcher import calibrate
+        report = calibrate(self, texts)
+        if apply:
+            self.fast_chars_per_word = report['fitted_chars_per_word']
+        return report
+
+    def analyze_text_multi(self, text, modes=('basic', 'weighted')):
+        """只分词一次，同时计算多种模式的分析结果
+
+        Args:
+            text (str): 要分析的文本
+            modes (iterable): 分析模式列表，可选值：
+                - 'basic': 基础分析模式
+                - 'weighted': 加权分析模式
+                - 'bert': BERT语义分析模式（需要use_bert=True）
+
+        Returns:
+            dict: 以模式名为键的分析结果
+        """
+        modes = list(modes)
+        unknown = [mode for mode in modes if mode not in ('basic', 'weighted', 'bert')]
+        if unknown:
+            raise ValueError(f"未知的分析模式: {', '.join(unknown)}")
+
+        results = {}
+        if 'basic' in modes or 'weighted' in modes:
+            segmentation = self.segment(text)
+            if 'basic' in modes:
+                results['basic'] = self._analyze_segmentation(segmentation)
+            if 'weighted' in modes:
+                results['weighted'] = self._analyze_segmentation_weighted(segmentation)
+        if 'bert' in modes:
+            if not self.use_bert:
+                raise ValueError('BERT分析器未初始化，请在初始化时设置use_bert=True')
+            results['bert'] = self.bert_analyzer.calculate_semantic_density(text)
+        return results
+
     def analyze_text_with_options(self, text, mode='weighted', output_type='simple'):
         """使用指定选项分析文本中的官方话语浓度
 
@@ -112,6 +234,7 @@ class BureaucrateseAnalyzer:
                 - 'basic': 基础分析模式
                 - 'weighted': 加权分析模式
                 - 'bert': BERT语义分析模式
+                - 'fast': 不分词的快速近似模式
             output_type (str): 输出类型，'simple'表示只输出浓度值，'full'表示输出完整分析信息
 
         Returns:
@@ -129,13 +252,19 @@ class BureaucrateseAnalyzer:
         """
         # 根据mode选择分析方法
         if mode == 'bert':
-            from .bert_analyzer import BertBureaucrateseAnalyzer
-            bert_analyzer = BertBureaucrateseAnalyzer()
+            if self.use_bert:
+                bert_analyzer = self.bert_analyzer
+            else:
+                from .registry import get_bert_analyzer
+                bert_analyzer = get_bert_analyzer(custom_dict_path=self.custom_dict_path)
             result = bert_analyzer.calculate_semantic_density(text)
             density_key = 'semantic_density'
         elif mode == 'weighted':
             result = self.analyze_text_weighted(text)
             density_key = 'weighted_density'
+        elif mode == 'fast':
+            result = self.analyze_text_fast(text)
+            density_key = 'density'
         else:  # basic mode
             result = self.analyze_text(text)
             density_key = 'density'
@@ -176,7 +305,31 @@ class BureaucrateseAnalyzer:
 
         return text
 
-    def analyze_file(self, file_path, text_column='text', weighted=False, as_dataframe=False):
+    def _analyze_texts(self, texts, weighted=False):
+        """分析一组文本，BERT语义分析按批次计算"""
+        results = []
+        for text in texts:
+            result = self.analyze_text_weighted(text) if weighted else self.analyze_text(text)
+            results.append(result)
+
+        if self.use_bert:
+            bert_results = self.bert_analyzer.calculate_semantic_density_batch(texts)
+            for result, bert_result in zip(results, bert_results):
+                result['semantic_density'] = bert_result['semantic_density']
+        return results
+
+    def _create_pool(self, n_jobs):
+        from .parallel import create_pool
+        return create_pool(n_jobs, custom_dict_path=self.custom_dict_path, use_bert=self.use_bert)
+
+    def _read_texts(self, file_path, text_column):
+        df = pd.read_csv(file_path)
+        if text_column not in df.columns:
+            raise ValueError(f"找不到列名 '{text_column}'")
+        return df[text_column].tolist()
+
+    def analyze_file(self, file_path, text_column='text', weighted=False, as_dataframe=False,
+                     n_jobs=1, chunk_size=256):
         """分析文件中的文本
         
         Args:
@@ -184,29 +337,29 @@ class BureaucrateseAnalyzer:
             text_column (str): 文本列的列名，默认为'text'
             weighted (bool): 是否使用加权分析
             as_dataframe (bool): 是否返回DataFrame格式的结果
+            n_jobs (int): 并行进程数，1表示在当前进程中分析，-1表示使用全部CPU核心
+            chunk_size (int): 多进程分析时每个任务包含的文本数
             
         Returns:
             list or pd.DataFrame: 分析结果
         """
         # 读取文件
-        df = pd.read_csv(file_path)
-        if text_column not in df.columns:
-            raise ValueError(f"找不到列名 '{text_column}'")
+        texts = self._read_texts(file_path, text_column)
         
         # 分析每个文本
-        results = []
-        for text in df[text_column]:
-            result = self.analyze_text_weighted(text) if weighted else self.analyze_text(text)
-            if self.use_bert:
-                bert_result = self.bert_analyzer.calculate_semantic_density(text)
-                result['semantic_density'] = bert_result['semantic_density']
-            results.append(result)
+        if n_jobs == 1:
+            results = self._analyze_texts(texts, weighted=weighted)
+        else:
+            from .parallel import submit_chunks, collect_chunks
+            with self._create_pool(n_jobs) as pool:
+                results = collect_chunks(submit_chunks(pool, texts, weighted=weighted, chunk_size=chunk_size))
         
         if as_dataframe:
             return pd.DataFrame(results)
         return results
 
-    def analyze_directory(self, dir_path, text_column='text', weighted=False, as_dataframe=False):
+    def analyze_directory(self, dir_path, text_column='text', weighted=False, as_dataframe=False,
+                          n_jobs=1, chunk_size=256):
         """分析目录中所有文件的文本
         
         Args:
@@ -214,6 +367,8 @@ class BureaucrateseAnalyzer:
             text_column (str): 文本列的列名，默认为'text'
             weighted (bool): 是否使用加权分析
             as_dataframe (bool): 是否返回DataFrame格式的结果
+            n_jobs (int): 并行进程数，1表示在当前进程中分析，-1表示使用全部CPU核心
+            chunk_size (int): 多进程分析时每个任务包含的文本数
             
         Returns:
             dict or pd.DataFrame: 分析结果，键为文件名
@@ -222,20 +377,46 @@ class BureaucrateseAnalyzer:
         if not dir_path.exists() or not dir_path.is_dir():
             raise ValueError(f"目录 '{dir_path}' 不存在或不是一个目录")
         
-        results = {}
-        for file_path in dir_path.glob('*.csv'):
-            try:
-                file_results = self.analyze_file(
-                    file_path, 
-                    text_column=text_column,
-                    weighted=weighted,
-                    as_dataframe=as_dataframe
-                )
-                results[file_path.name] = file_results
-            except Exception as e:
-                print(f"处理文件 {file_path} 时出错: {str(e)}")
-                continue
+        if n_jobs != 1:
+            results = self._analyze_directory_parallel(dir_path, text_column, weighted, as_dataframe, n_jobs, chunk_size)
+        else:
+            results = {}
+            for file_path in dir_path.glob('*.csv'):
+                try:
+                    file_results = self.analyze_file(
+                        file_path, 
+                        text_column=text_column,
+                        weighted=weighted,
+                        as_dataframe=as_dataframe
+                    )
+                    results[file_path.name] = file_results
+                except Exception as e:
+                    print(f"处理文件 {file_path} 时出错: {str(e)}")
+                    continue
         
         if as_dataframe:
             return pd.concat(results, names=['file', 'index'])
-        return results
\ No newline at end of file
+        return results
+
+    def _analyze_directory_parallel(self, dir_path, text_column, weighted, as_dataframe, n_jobs, chunk_size):
+        """所有文件的文本块提交到同一个进程池，小文件之间也能并行"""
+        from .parallel import submit_chunks, collect_chunks
+
+        results = {}
+        with self._create_pool(n_jobs) as pool:
+            pending = []
+            for file_path in dir_path.glob('*.csv'):
+                try:
+                    texts = self._read_texts(file_path, text_column)
+                    pending.append((file_path, submit_chunks(pool, texts, weighted=weighted, chunk_size=chunk_size)))
+                except Exception as e:
+                    print(f"处理文件 {file_path} 时出错: {str(e)}")
+
+            for file_path, futures in pending:
+                try:
+                    file_results = collect_chunks(futures)
+                    results[file_path.name] = pd.DataFrame(file_results) if as_dataframe else file_results
+                except Exception as e:
+                    print(f"处理文件 {file_path} 时出错: {str(e)}")
+                    continue
+        return results
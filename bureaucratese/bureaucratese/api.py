@@ -1,19 +1,53 @@
 from typing import List, Dict, Union
 from .analyzer import BureaucrateseAnalyzer
-from .bert_analyzer import BertBureaucrateseAnalyzer
+from .registry import get_bert_analyzer
+from .cache import ResultCache, make_cache_key
+
+# 需要BERT模型的分析方法
+SEMANTIC_METHODS = ('semantic', 'semantic_long', 'semantic_sentences')
 
 class BureaucrateseAPI:
-    def __init__(self, use_bert: bool = True, custom_dict_path: str = None):
+    def __init__(self, use_bert: bool = True, custom_dict_path: str = None,
+                 cache_size: int = 10000, cache_path: str = None):
         """初始化官方话语分析API
 
         Args:
             use_bert (bool): 是否使用BERT模型进行语义分析
             custom_dict_path (str): 自定义词典路径
+            cache_size (int): 内存结果缓存的容量，为0且未设置cache_path时不使用缓存
+            cache_path (str): 结果缓存的SQLite磁盘层路径，服务重启后缓存仍然有效
         """
         self.analyzer = BureaucrateseAnalyzer(custom_dict_path=custom_dict_path)
-        self.bert_analyzer = BertBureaucrateseAnalyzer(custom_dict_path=custom_dict_path) if use_bert else None
+        self.bert_analyzer = get_bert_analyzer(custom_dict_path=custom_dict_path) if use_bert else None
+        self.cache = ResultCache(cache_size, cache_path) if cache_size or cache_path else None
+
+    def _cache_version(self, method: str) -> str:
+        """返回分析方法对应的词典或模型版本，词典或模型变化后缓存自动失效"""
+        dictionary_version = self.analyzer.dictionary.source_hash[:16]
+        if method in SEMANTIC_METHODS:
+            return f'{self.bert_analyzer.inference_key}:{self.bert_analyzer.dictionary_hash[:16]}'
+        if method == 'fast':
+            return f'{dictionary_version}:{self.analyzer.fast_chars_per_word}'
+        return dictionary_version
+
+    def _cache_method(self, method: str) -> str:
+        return method if method in SEMANTIC_METHODS + ('weighted', 'fast') else 'basic'
+
+    def cache_stats(self) -> Dict:
+        """返回结果缓存和句子向量缓存的命中和未命中计数"""
+        stats = self.cache.stats() if self.cache is not None else {}
+        if self.bert_analyzer:
+            stats['sentence_cache'] = self.bert_analyzer.sentence_cache.stats()
+        return stats
+
+    def _check_top_k(self, method: str, top_k: int):
+        if top_k > 0 and method != 'semantic':
+            raise ValueError("top_k只适用于'semantic'分析方法")
+
+    def _cache_method_key(self, method: str, top_k: int) -> str:
+        return f'{method}:top{top_k}' if top_k > 0 else method
 
-    def analyze_text(self, text: str, method: str = 'basic') -> Dict:
+    def analyze_text(self, text: str, method: str = 'basic', top_k: int = 0) -> Dict:
         """分析单个文本的官方话语浓度
 
         Args:
@@ -22,30 +56,94 @@ class BureaucrateseAPI:
                 - 'basic': 基础密度分析
                 - 'weighted': 加权密度分析
                 - 'semantic': BERT语义分析
+                - 'semantic_long': 长文档BERT语义分析，超过512个token的文本按窗口汇总
+                - 'semantic_sentences': 句子级BERT语义分析，重复出现的句子复用缓存的向量
+                - 'fast': 不分词的快速近似分析
+            top_k (int): 大于0时语义分析结果中加入与文本最相近的top_k个官方话语词语
 
         Returns:
             Dict: 分析结果
         """
+        self._check_top_k(method, top_k)
+        if method in SEMANTIC_METHODS and not self.bert_analyzer:
+            raise ValueError('BERT分析器未初始化，请在初始化API时设置use_bert=True')
+        if self.cache is None or not isinstance(text, str):
+            return self._analyze_text(text, method, top_k)
+
+        method = self._cache_method(method)
+        key = make_cache_key(text, self._cache_method_key(method, top_k), self._cache_version(method))
+        result = self.cache.get(key)
+        if result is None:
+            result = self._analyze_text(text, method, top_k)
+            self.cache.put(key, result)
+        return result
+
+    def _analyze_text(self, text: str, method: str, top_k: int = 0) -> Dict:
         if method == 'semantic':
-            if not self.bert_analyzer:
-                raise ValueError('BERT分析器未初始化，请在初始化API时设置use_bert=True')
-            return self.bert_analyzer.calculate_semantic_density(text)
+            return self.bert_analyzer.calculate_semantic_density(text, top_k=top_k)
+        elif method == 'semantic_long':
+            return self.bert_analyzer.calculate_semantic_density_long([text])[0]
+        elif method == 'semantic_sentences':
+            return self.bert_analyzer.calculate_semantic_density_sentences([text])[0]
         elif method == 'weighted':
             return self.analyzer.analyze_text_weighted(text)
+        elif method == 'fast':
+            return self.analyzer.analyze_text_fast(text)
         else:
             return self.analyzer.analyze_text(text)
 
-    def analyze_texts(self, texts: List[str], method: str = 'basic') -> List[Dict]:
+    def analyze_texts(self, texts: List[str], method: str = 'basic', top_k: int = 0) -> List[Dict]:
         """批量分析多个文本的官方话语浓度
 
         Args:
             texts (List[str]): 待分析的文本列表
             method (str): 分析方法，可选值同analyze_text
+            top_k (int): 同analyze_text
 
         Returns:
             List[Dict]: 分析结果列表
         """
-        return [self.analyze_text(text, method) for text in texts]
+        self._check_top_k(method, top_k)
+        if method in SEMANTIC_METHODS and not self.bert_analyzer:
+            raise ValueError('BERT分析器未初始化，请在初始化API时设置use_bert=True')
+        method = self._cache_method(method)
+        if self.cache is None:
+            return self._analyze_batch(texts, method, top_k)
+
+        # 先查缓存，只对未命中的文本计算，BERT方法做一次批量推理，结果一次写入缓存
+        version = self._cache_version(method)
+        method_key = self._cache_method_key(method, top_k)
+        results = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            if isinstance(text, str):
+                results[i] = self.cache.get(make_cache_key(text, method_key, version))
+            if results[i] is None:
+                missing.append(i)
+
+        if missing:
+            computed = self._analyze_batch([texts[i] for i in missing], method, top_k)
+            new_entries = []
+            for i, result in zip(missing, computed):
+                results[i] = result
+                if isinstance(texts[i], str):
+                    new_entries.append((make_cache_key(texts[i], method_key, version), result))
+            self.cache.put_many(new_entries)
+        return results
+
+    def _analyze_batch(self, texts: List[str], method: str, top_k: int = 0) -> List[Dict]:
+        if method in SEMANTIC_METHODS:
+            return self._analyze_semantic_batch(texts, method, top_k)
+        return [self._analyze_text(text, method) for text in texts]
+
+    def _analyze_semantic_batch(self, texts: List[str], method: str, top_k: int = 0) -> List[Dict]:
+        if method == 'semantic_long':
+            # 所有文本的所有窗口一起分桶批量推理
+            return self.bert_analyzer.calculate_semantic_density_long(texts)
+        if method == 'semantic_sentences':
+            # 批内重复的句子只推理一次
+            return self.bert_analyzer.calculate_semantic_density_sentences(texts)
+        return self.bert_analyzer.calculate_semantic_density_batch(texts, top_k=top_k)
 
     def analyze_text_all(self, text: str) -> Dict[str, Dict]:
         """使用所有可用方法分析文本
@@ -56,10 +154,8 @@ class BureaucrateseAPI:
         Returns:
             Dict[str, Dict]: 包含所有分析方法结果的字典
         """
-        results = {
-            'basic': self.analyzer.analyze_text(text),
-            'weighted': self.analyzer.analyze_text_weighted(text)
-        }
+        # 基础和加权分析共用同一次分词结果
+        results = self.analyzer.analyze_text_multi(text, modes=('basic', 'weighted'))
         
         if self.bert_analyzer:
             results['semantic'] = self.bert_analyzer.calculate_semantic_density(text)
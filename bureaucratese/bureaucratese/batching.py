@@ -0,0 +1,119 @@
+"""Web服务中BERT请求的动态微批处理
+
+单个HTTP请求只包含一个文本，逐个做前向计算时，并发请求只能排队执行单条推理。
+MicroBatcher把并发到达的请求放入asyncio队列，最多等待max_wait_ms毫秒或凑满
+max_batch_size条后合并为一批，在线程池中做一次批量推理，再把各自的结果交还给
+等待中的请求。单个请求的延迟最多增加max_wait_ms，并发较高时吞吐量显著提升。
+"""
+import asyncio
+import os
+
+from .metrics import observe_batch_size
+
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get('BUREAUCRATESE_MAX_BATCH_SIZE', 32))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get('BUREAUCRATESE_MAX_WAIT_MS', 5))
+
+
+class MicroBatcher:
+    """将并发提交的单条请求合并为批量调用
+
+    Args:
+        process_batch (callable): 批处理函数，接收条目列表，返回等长的结果列表；
+            在线程池中执行，不阻塞事件循环
+        max_batch_size (int): 每批最多合并的条目数
+        max_wait_ms (float): 收到第一条后最多等待的毫秒数
+    """
+
+    def __init__(self, process_batch, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size必须大于0')
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_started(self):
+        # 队列和后台任务必须创建在处理请求的事件循环上
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        """提交一条请求，等待所在批次完成后返回该条的结果"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        """等待第一条请求，再在时间窗口内尽量凑满一批"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # 窗口结束时已在队列中的请求一并处理
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # 调用方断开连接后其future已被取消，不再为它计算
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            observe_batch_size('micro_batch', len(items))
+            try:
+                results = await loop.run_in_executor(None, self.process_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        """停止后台任务，尚未处理的请求以取消结束"""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            future.cancel()
+
+    def queue_depth(self):
+        """返回排队等待合并的请求数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        """返回已处理的批次数、平均批大小和排队的请求数"""
+        return {
+            'batches': self.batches,
+            'queue_depth': self.queue_depth(),
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0
+        }
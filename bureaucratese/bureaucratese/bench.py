@@ -0,0 +1,360 @@
+"""性能基准测试
+
+生成可控长度和官方话语比例的合成语料，测量各阶段耗时（词典加载、分词、
+官方话语查找、BERT分词、前向计算、相似度计算）以及各分析模式在不同批大小
+和进程数下的吞吐量。结果保存为JSON，并可与之前保存的基线比较，
+吞吐量下降或阶段耗时增加超过容差时以非零状态退出：
+
+    python -m bureaucratese.bench --output bench.json --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+
+DEFAULT_MODES = ('basic', 'weighted', 'fast', 'semantic')
+DEFAULT_BATCH_SIZES = (1, 8, 32)
+DEFAULT_N_JOBS = (1, 2)
+DEFAULT_TOLERANCE = 0.1
+
+# 合成文本中的日常词语
+FILLER_WORDS = [
+    '今天', '我们', '市民', '记者', '表示', '上午', '下午', '学校', '医院', '公司', '天气', '朋友',
+    '家里', '孩子', '老人', '城市', '街道', '商店', '价格', '时间', '问题', '情况', '活动', '比赛',
+    '电影', '音乐', '网络', '手机', '交通', '地铁', '巴士', '餐厅', '早餐', '周末', '假期', '旅游',
+    '看到', '觉得', '已经', '开始', '继续', '发现', '希望', '认为', '准备', '参加', '举行', '进行',
+    '很多', '一些', '大家', '没有', '可以', '需要', '因为', '所以', '但是', '而且', '如果', '虽然'
+]
+PUNCTUATION = ['，', '，', '，', '。', '。', '；', '！', '？']
+
+
+def generate_corpus(official_words, n_docs=1000, min_length=100, max_length=800, official_rate=0.1,
+                    duplicate_rate=0.0, seed=0):
+    """生成合成语料
+
+    Args:
+        official_words (list): 官方话语词语
+        n_docs (int): 文本数
+        min_length (int): 每个文本的最小字数
+        max_length (int): 每个文本的最大字数
+        official_rate (float): 每个词为官方话语的概率
+        duplicate_rate (float): 每个文本复用已生成文本的概率，模拟转载的通稿
+        seed (int): 随机种子，相同参数生成相同的语料
+
+    Returns:
+        list: 文本列表
+    """
+    rng = random.Random(seed)
+    official_words = [word for word in official_words if isinstance(word, str) and word]
+    texts = []
+    for _ in range(n_docs):
+        if texts and rng.random() < duplicate_rate:
+            texts.append(rng.choice(texts))
+            continue
+        target_length = rng.randint(min_length, max_length)
+        parts = []
+        length = 0
+        while length < target_length:
+            if official_words and rng.random() < official_rate:
+                word = rng.choice(official_words)
+            else:
+                word = rng.choice(FILLER_WORDS)
+            parts.append(word)
+            length += len(word)
+            if rng.random() < 0.15:
+                parts.append(rng.choice(PUNCTUATION))
+                length += 1
+        texts.append(''.join(parts) + '。')
+    return texts
+
+
+def _best_of(func, repeat):
+    """重复执行repeat次，返回最短耗时（秒）和最后一次的返回值"""
+    best = float('inf')
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _stage(seconds, n):
+    return {'seconds': seconds, 'per_item_ms': seconds * 1000 / n if n else 0.0}
+
+
+def measure_stages(texts, custom_dict_path=None, semantic=True, batch_size=32, repeat=3):
+    """测量各阶段的耗时
+
+    Returns:
+        dict: 阶段名称 -> {'seconds': 总耗时, 'per_item_ms': 每个文本的平均毫秒数}
+    """
+    from .analyzer import BureaucrateseAnalyzer, SegmentationResult
+    from .dictionary import load_dictionary
+
+    stages = {}
+    seconds, _ = _best_of(lambda: load_dictionary(custom_dict_path, use_cache=False), repeat)
+    stages['dictionary_load'] = _stage(seconds, 1)
+
+    analyzer = BureaucrateseAnalyzer(custom_dict_path=custom_dict_path)
+    seconds, segmented = _best_of(
+        lambda: [[word for word in analyzer.tokenizer.cut(text) if word.strip()] for text in texts], repeat
+    )
+    stages['segmentation'] = _stage(seconds, len(texts))
+
+    official_words = analyzer.official_words
+    seconds, _ = _best_of(lambda: [
+        analyzer._analyze_segmentation(SegmentationResult(words, [word for word in words if word in official_words]))
+        for words in segmented
+    ], repeat)
+    stages['lookup'] = _stage(seconds, len(texts))
+
+    if semantic:
+        from .registry import get_bert_analyzer
+        bert_analyzer = get_bert_analyzer(custom_dict_path=custom_dict_path)
+        seconds, token_ids = _best_of(
+            lambda: bert_analyzer.tokenizer(texts, truncation=True, max_length=512)['input_ids'], repeat
+        )
+        stages['tokenization'] = _stage(seconds, len(texts))
+        seconds, embeddings = _best_of(lambda: bert_analyzer._embed_token_ids(token_ids, batch_size=batch_size), repeat)
+        stages['forward_pass'] = _stage(seconds, len(texts))
+        seconds, _ = _best_of(lambda: bert_analyzer._score_embeddings(embeddings), repeat)
+        stages['cosine_scoring'] = _stage(seconds, len(texts))
+    return stages
+
+
+def _run_pool(texts, n_jobs, weighted, custom_dict_path):
+    from .parallel import create_pool, submit_chunks, collect_chunks
+    with create_pool(n_jobs, custom_dict_path=custom_dict_path) as pool:
+        # 先让每个工作进程完成初始化，计时只包括分析本身
+        collect_chunks(submit_chunks(pool, texts[:n_jobs], weighted=weighted, chunk_size=1))
+        start = time.perf_counter()
+        collect_chunks(submit_chunks(pool, texts, weighted=weighted))
+        return time.perf_counter() - start
+
+
+def measure_throughput(texts, modes=DEFAULT_MODES, batch_sizes=DEFAULT_BATCH_SIZES, n_jobs_list=DEFAULT_N_JOBS,
+                       custom_dict_path=None, repeat=3):
+    """测量各分析模式的吞吐量
+
+    basic和weighted在每个进程数下测量，semantic在每个批大小下测量，fast只在单进程下测量。
+
+    Returns:
+        list: [{'mode', 'batch_size', 'n_jobs', 'docs', 'seconds', 'docs_per_second'}]
+    """
+    from .analyzer import BureaucrateseAnalyzer
+
+    analyzer = BureaucrateseAnalyzer(custom_dict_path=custom_dict_path)
+    rows = []
+
+    def record(mode, seconds, batch_size=None, n_jobs=1):
+        rows.append({
+            'mode': mode,
+            'batch_size': batch_size,
+            'n_jobs': n_jobs,
+            'docs': len(texts),
+            'seconds': seconds,
+            'docs_per_second': len(texts) / seconds if seconds > 0 else float('inf')
+        })
+
+    for mode in ('basic', 'weighted'):
+        if mode not in modes:
+            continue
+        for n_jobs in n_jobs_list:
+            if n_jobs == 1:
+                func = analyzer.analyze_text_weighted if mode == 'weighted' else analyzer.analyze_text
+                seconds, _ = _best_of(lambda: [func(text) for text in texts], repeat)
+            else:
+                seconds = min(
+                    _run_pool(texts, n_jobs, mode == 'weighted', custom_dict_path)
+                    for _ in range(max(repeat, 1))
+                )
+            record(mode, seconds, n_jobs=n_jobs)
+
+    if 'fast' in modes:
+        analyzer._get_matcher()
+        seconds, _ = _best_of(lambda: [analyzer.analyze_text_fast(text) for text in texts], repeat)
+        record('fast', seconds)
+
+    if 'semantic' in modes:
+        from .registry import get_bert_analyzer
+        bert_analyzer = get_bert_analyzer(custom_dict_path=custom_dict_path)
+        for batch_size in batch_sizes:
+            seconds, _ = _best_of(
+                lambda: bert_analyzer.calculate_semantic_density_batch(texts, batch_size=batch_size), repeat
+            )
+            record('semantic', seconds, batch_size=batch_size)
+    return rows
+
+
+def environment():
+    """返回运行环境信息，比较基线时用于提示环境差异"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def run_benchmark(n_docs=1000, min_length=100, max_length=800, official_rate=0.1, duplicate_rate=0.0,
+                  modes=DEFAULT_MODES, batch_sizes=DEFAULT_BATCH_SIZES, n_jobs_list=DEFAULT_N_JOBS,
+                  custom_dict_path=None, repeat=3, seed=0):
+    """生成语料并运行全部测量
+
+    Returns:
+        dict: 包括environment、config、stages和throughput
+    """
+    from .dictionary import load_dictionary
+
+    official_words = load_dictionary(custom_dict_path).official_word_list
+    texts = generate_corpus(official_words, n_docs=n_docs, min_length=min_length, max_length=max_length,
+                            official_rate=official_rate, duplicate_rate=duplicate_rate, seed=seed)
+    config = {
+        'n_docs': n_docs,
+        'min_length': min_length,
+        'max_length': max_length,
+        'official_rate': official_rate,
+        'duplicate_rate': duplicate_rate,
+        'modes': list(modes),
+        'batch_sizes': list(batch_sizes),
+        'n_jobs': list(n_jobs_list),
+        'repeat': repeat,
+        'seed': seed
+    }
+    return {
+        'environment': environment(),
+        'config': config,
+        'stages': measure_stages(texts, custom_dict_path, semantic='semantic' in modes,
+                                 batch_size=max(batch_sizes), repeat=repeat),
+        'throughput': measure_throughput(texts, modes, batch_sizes, n_jobs_list, custom_dict_path, repeat)
+    }
+
+
+def _throughput_key(row):
+    return (row['mode'], row['batch_size'], row['n_jobs'])
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """与基线比较
+
+    Args:
+        results (dict): run_benchmark的结果
+        baseline (dict): 之前保存的结果
+        tolerance (float): 允许的相对变化，0.1表示吞吐量下降或耗时增加不超过10%
+
+    Returns:
+        list: 每项可比较指标的{'metric', 'baseline', 'current', 'change', 'regression'}，
+            change为相对变化，正数表示变好
+    """
+    comparisons = []
+    for name, stage in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or base['seconds'] <= 0:
+            continue
+        change = base['seconds'] / stage['seconds'] - 1 if stage['seconds'] > 0 else float('inf')
+        comparisons.append({
+            'metric': f'stage:{name}',
+            'baseline': base['seconds'],
+            'current': stage['seconds'],
+            'change': change,
+            'regression': change < -tolerance
+        })
+
+    base_rows = {_throughput_key(row): row for row in baseline.get('throughput', [])}
+    for row in results['throughput']:
+        base = base_rows.get(_throughput_key(row))
+        if not base or base['docs_per_second'] <= 0:
+            continue
+        change = row['docs_per_second'] / base['docs_per_second'] - 1
+        mode, batch_size, n_jobs = _throughput_key(row)
+        comparisons.append({
+            'metric': f'throughput:{mode}:batch={batch_size}:jobs={n_jobs}',
+            'baseline': base['docs_per_second'],
+            'current': row['docs_per_second'],
+            'change': change,
+            'regression': change < -tolerance
+        })
+    return comparisons
+
+
+def format_report(results, comparisons=None):
+    """把结果整理为便于阅读的文本"""
+    lines = ['阶段耗时：']
+    for name, stage in results['stages'].items():
+        lines.append(f"  {name:<16}{stage['seconds']:>10.4f}s{stage['per_item_ms']:>12.3f} ms/项")
+    lines.append('吞吐量：')
+    for row in results['throughput']:
+        label = f"{row['mode']} batch={row['batch_size']} jobs={row['n_jobs']}"
+        lines.append(f"  {label:<32}{row['docs_per_second']:>12.1f} 篇/秒")
+    if comparisons:
+        lines.append('与基线比较：')
+        for item in comparisons:
+            flag = '  回退' if item['regression'] else ''
+            lines.append(f"  {item['metric']:<40}{item['change']:>+9.1%}{flag}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    def int_list(value):
+        return [int(item) for item in value.split(',') if item]
+
+    parser = argparse.ArgumentParser(description='运行性能基准测试并与基线比较')
+    parser.add_argument('--docs', type=int, default=1000, help='合成文本数')
+    parser.add_argument('--min-length', type=int, default=100, help='每个文本的最小字数')
+    parser.add_argument('--max-length', type=int, default=800, help='每个文本的最大字数')
+    parser.add_argument('--official-rate', type=float, default=0.1, help='每个词为官方话语的概率')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help='复用已生成文本的概率')
+    parser.add_argument('--modes', default=','.join(DEFAULT_MODES), help='测量的分析模式，逗号分隔')
+    parser.add_argument('--batch-sizes', type=int_list, default=list(DEFAULT_BATCH_SIZES), help='语义分析的批大小，逗号分隔')
+    parser.add_argument('--n-jobs', type=int_list, default=list(DEFAULT_N_JOBS), help='基础和加权模式的进程数，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最短耗时')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--dict-path', default=None, help='自定义词典路径')
+    parser.add_argument('--output', default=None, help='结果JSON文件路径')
+    parser.add_argument('--baseline', default=None, help='用于比较的基线JSON文件路径')
+    parser.add_argument('--save-baseline', default=None, help='把本次结果保存为基线')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='允许的相对回退')
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        n_docs=args.docs,
+        min_length=args.min_length,
+        max_length=args.max_length,
+        official_rate=args.official_rate,
+        duplicate_rate=args.duplicate_rate,
+        modes=[mode.strip() for mode in args.modes.split(',') if mode.strip()],
+        batch_sizes=args.batch_sizes,
+        n_jobs_list=args.n_jobs,
+        custom_dict_path=args.dict_path,
+        repeat=args.repeat,
+        seed=args.seed
+    )
+
+    comparisons = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != results['environment']:
+            print('提示：基线的运行环境与本次不同，比较结果仅供参考')
+        comparisons = compare(results, baseline, args.tolerance)
+        results['comparison'] = comparisons
+
+    print(format_report(results, comparisons))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if comparisons and any(item['regression'] for item in comparisons):
+        sys.exit(1)
@@ -3,16 +3,96 @@ from transformers import BertModel, BertTokenizer
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import threading
 import jieba
 import logging
 from .download_bert import load_local_bert
+from .dictionary import load_vocabulary
+from .preprocess_embeddings import load_official_embeddings, model_fingerprint, dictionary_fingerprint
+from .index import OfficialTermIndex
+from .inference import create_backend
+from .embedding_cache import EmbeddingCache, split_sentences, sentence_key, DEFAULT_SENTENCE_CACHE_SIZE
+from .metrics import observe_batch_size
+from .profiling import stage
 
 # 配置jieba的日志级别
 jieba.setLogLevel(logging.INFO)
 
+# BERT的最大输入长度，长文档按该长度切分窗口
+MAX_SEQUENCE_LENGTH = 512
+# 相邻窗口重叠的token数，使跨窗口边界的表达至少完整出现在一个窗口中
+DEFAULT_WINDOW_OVERLAP = 128
+# 长文档模式每次前向计算最多包含的token数（含填充）
+DEFAULT_MAX_BATCH_TOKENS = 32 * MAX_SEQUENCE_LENGTH
+# 把窗口或句子的相似度汇总为文档相似度的方式
+POOLING_METHODS = ('mean', 'length')
+
+def _plan_batches(order, token_ids, batch_size, max_batch_tokens=None):
+    """按已排序的序列顺序划分批次
+
+    每个批次不超过batch_size条序列；设置max_batch_tokens时，批次填充后的
+    token数（条数×批内最长长度）也不超过该值。
+    """
+    batch = []
+    for i in order:
+        # 序列按长度升序排列，加入i后批内最长长度即为len(token_ids[i])
+        if batch and (
+            len(batch) >= batch_size
+            or (max_batch_tokens is not None and (len(batch) + 1) * len(token_ids[i]) > max_batch_tokens)
+        ):
+            yield batch
+            batch = []
+        batch.append(i)
+    if batch:
+        yield batch
+
+def _check_pooling(pooling):
+    if pooling not in POOLING_METHODS:
+        raise ValueError(f"pooling必须为{', '.join(POOLING_METHODS)}之一")
+
+
+def _pool(similarities, lengths, pooling):
+    """把一个文档各部分（窗口或句子）的相似度汇总为文档的加权相似度
+
+    Args:
+        similarities (np.ndarray): 各部分的相似度，不能为空
+        lengths (list): 各部分的长度，pooling为'length'时作为权重
+        pooling (str): 'mean'为算术平均，'length'按长度加权
+
+    Returns:
+        dict: 与calculate_semantic_density格式相同的结果
+    """
+    if pooling == 'length':
+        weights = np.asarray(lengths, dtype=np.float32)
+        weighted_similarity = float(similarities @ weights / max(weights.sum(), 1.0))
+    else:
+        weighted_similarity = float(similarities.mean())
+    return {
+        'semantic_density': (weighted_similarity + 1) / 2,
+        'weighted_similarity': weighted_similarity
+    }
+
+
 class BertBureaucrateseAnalyzer:
-    def __init__(self, model_name='bert-base-chinese', custom_dict_path=None, use_local_model=True):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    def __init__(self, model_name='bert-base-chinese', custom_dict_path=None, use_local_model=True, device=None,
+                 backend='eager', quantize=False, sentence_cache_size=DEFAULT_SENTENCE_CACHE_SIZE):
+        """初始化BERT语义分析器
+
+        Args:
+            model_name (str): BERT模型名称
+            custom_dict_path (str, optional): 自定义词典路径
+            use_local_model (bool): 是否优先加载本地模型
+            device (str, optional): 运行设备，默认自动选择cuda或cpu
+            backend (str): 文本推理后端，'eager'、'torchscript'或'onnx'，见inference模块
+            quantize (bool): 是否对推理后端做动态int8量化
+            sentence_cache_size (int): 句子模式最多缓存的句子向量数
+        """
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
+        self.model_name = model_name
+        # 本实例专用的剖析钩子，对所有线程生效；共享的实例应使用profiling.attach
+        self.profiler = None
         
         # 尝试加载本地模型，如果失败则从在线下载
         if use_local_model:
@@ -34,82 +114,317 @@ class BertBureaucrateseAnalyzer:
         # 加载词典并初始化词向量
         self._load_dictionary(custom_dict_path)
         self._initialize_word_embeddings()
+        
+        # 官方话语词向量始终由原模型计算，文本向量由选定的推理后端计算
+        self.backend_name = backend
+        self.quantize = quantize
+        self.backend = create_backend(backend, self.model, self.device, self.model_key, quantize=quantize)
+        # 不同的后端和量化方式得到的结果略有差异，结果缓存按此区分
+        self.inference_key = f"{self.model_key[:16]}-{backend}{'-int8' if quantize else ''}"
+        self.sentence_cache = EmbeddingCache(sentence_cache_size, namespace=self.inference_key)
     
     def _load_dictionary(self, custom_dict_path=None):
-        if custom_dict_path is None:
-            package_dir = Path(__file__).parent
-            custom_dict_path = package_dir / '../data/RAWdataset.csv'
-        
-        df = pd.read_csv(custom_dict_path)
-        self.official_words = df[df['typeOfWord'] == '官方话语']['Word'].tolist()
-        self.word_frequencies = dict(zip(df['Word'], df['Frequency']))
+        # 语义分析不分词，只需要官方话语词语和词频，不保留jieba前缀词典
+        self.dictionary_hash, self.official_words, self.word_frequencies = load_vocabulary(custom_dict_path)
     
     def _initialize_word_embeddings(self):
-        """初始化官方话语的BERT词向量，优先从预处理文件加载"""
-        package_dir = Path(__file__).parent
-        preprocessed_dir = package_dir / 'preprocessed'
-        embeddings_file = preprocessed_dir / 'official_embeddings.npy'
-        weights_file = preprocessed_dir / 'official_weights.npy'
-        
-        # 尝试从预处理文件加载
-        if embeddings_file.exists() and weights_file.exists():
-            print("从预处理文件加载词向量和权重...")
-            self.official_embeddings = np.load(embeddings_file)
-            self.official_weights = np.load(weights_file)
-            return
-        
-        print("预处理文件不存在，重新计算词向量...")
-        self.official_embeddings = []
-        self.official_weights = []
-        
-        with torch.no_grad():
-            for word in self.official_words:
-                inputs = self.tokenizer(word, return_tensors='pt', padding=True)
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                outputs = self.model(**inputs)
-                # 使用[CLS]标记的输出作为词的表示
-                embedding = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-                self.official_embeddings.append(embedding[0])
-                self.official_weights.append(self.word_frequencies.get(word, 1.0))
-        
-        self.official_embeddings = np.array(self.official_embeddings)
-        self.official_weights = np.array(self.official_weights)
-        # 归一化权重
-        self.official_weights = self.official_weights / np.sum(self.official_weights)
+        """初始化官方话语的BERT词向量，优先从与模型和词典匹配的预处理缓存加载
+
+        预处理文件中的词向量已经L2归一化为float32矩阵，并以只读内存映射方式打开，
+        多个工作进程共享同一份物理内存。
+        """
+        # 模型指纹同时用作词向量缓存和分析结果缓存的版本标识
+        self.model_key = model_fingerprint(self.model_name, self.model)
+        self.official_embeddings, self.official_weights = load_official_embeddings(
+            self.tokenizer,
+            self.model,
+            self.model_name,
+            self.official_words,
+            self.word_frequencies,
+            self.device,
+            model_key=self.model_key
+        )
+        # 加权平均相似度 (E·t)·w 等于 t·(Eᵀw)，预先算出加权中心向量后，
+        # 每个文本的打分只需一次与词表大小无关的点积
+        self.official_centroid = np.asarray(self.official_weights @ self.official_embeddings, dtype=np.float32)
+        self._term_index = None
+        self._term_index_lock = threading.Lock()
+    
+    def get_term_index(self):
+        """返回官方话语词向量的近邻索引，第一次调用时构建或从缓存加载
+
+        并发的第一次请求只构建一次索引，其余请求等待构建完成。
+        """
+        if self._term_index is None:
+            with self._term_index_lock:
+                if self._term_index is None:
+                    cache_key = f'{self.model_key[:16]}-{dictionary_fingerprint(self.official_words, self.word_frequencies)[:16]}'
+                    self._term_index = OfficialTermIndex(self.official_embeddings, self.official_words, cache_key=cache_key)
+        return self._term_index
+    
+    def _add_top_terms(self, results, text_embeddings, top_k):
+        """为每个结果加上与文本最相近的top_k个官方话语词语"""
+        text_embeddings = np.asarray(text_embeddings, dtype=np.float32)
+        text_embeddings = text_embeddings / np.maximum(np.linalg.norm(text_embeddings, axis=1, keepdims=True), 1e-12)
+        with stage(self, 'top_terms'):
+            all_top_terms = self.get_term_index().search(text_embeddings, k=top_k)
+        for result, top_terms in zip(results, all_top_terms):
+            result['top_terms'] = top_terms
+        return results
+    
+    def _tokenize(self, texts, **kwargs):
+        """对文本列表做BERT分词，返回token id序列列表"""
+        with stage(self, 'tokenization'):
+            return self.tokenizer(texts, **kwargs)['input_ids']
     
     def get_text_embedding(self, text):
         """获取文本的BERT嵌入表示"""
-        with torch.no_grad():
-            inputs = self.tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=512)
-            inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            outputs = self.model(**inputs)
-            return outputs.last_hidden_state[:, 0, :].cpu().numpy()[0]
+        token_ids = self._tokenize([text], truncation=True, max_length=512)
+        return self._embed_token_ids(token_ids)[0]
     
-    def calculate_semantic_density(self, text):
+    def get_text_embeddings(self, texts, batch_size=32):
+        """批量获取多个文本的BERT嵌入表示
+
+        文本先按分词后的长度排序分桶，每个批次只填充到批内最长的长度，
+        每个批次只做一次前向计算，结果按输入顺序返回。
+
+        Args:
+            texts (list): 文本列表
+            batch_size (int): 每次前向计算的文本数
+
+        Returns:
+            np.ndarray: 形状为(len(texts), hidden_size)的嵌入矩阵
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.model.config.hidden_size), dtype=np.float32)
+        token_ids = self._tokenize(texts, truncation=True, max_length=512)
+        return self._embed_token_ids(token_ids, batch_size=batch_size)
+
+    def _embed_token_ids(self, token_ids, batch_size=32, max_batch_tokens=None):
+        """对已分词的序列按长度分桶、动态填充后批量计算[CLS]向量
+
+        Args:
+            token_ids (list): 含特殊符号的token id序列列表
+            batch_size (int): 每次前向计算最多包含的序列数
+            max_batch_tokens (int, optional): 每次前向计算最多包含的token数（含填充），
+                短序列的批次因此可以更大，长序列的批次更小，计算量与总token数近似成正比
+        """
+        # 按长度排序，使同一批次内的序列长度接近，减少填充浪费
+        order = sorted(range(len(token_ids)), key=lambda i: len(token_ids[i]))
+        embeddings = np.empty((len(token_ids), self.model.config.hidden_size), dtype=np.float32)
+        pad_token_id = self.tokenizer.pad_token_id
+
+        for batch_indices in _plan_batches(order, token_ids, batch_size, max_batch_tokens):
+            max_len = max(len(token_ids[i]) for i in batch_indices)
+
+            input_ids = torch.full((len(batch_indices), max_len), pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(batch_indices), max_len), dtype=torch.long)
+            for row, i in enumerate(batch_indices):
+                ids = token_ids[i]
+                input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, :len(ids)] = 1
+
+            observe_batch_size('inference', len(batch_indices))
+            with stage(self, 'forward_pass'):
+                embeddings[batch_indices] = self.backend(input_ids, attention_mask, torch.zeros_like(input_ids))
+
+        return embeddings
+
+    def calculate_semantic_density(self, text, top_k=0):
         """计算文本的语义浓度
         
         基于文本的BERT表示与官方话语词向量的加权余弦相似度来计算浓度
+
+        Args:
+            text (str): 文本
+            top_k (int): 大于0时在结果中加入top_terms，即与文本最相近的top_k个官方话语词语
         """
         # 确保输入文本是字符串类型
         if not isinstance(text, str) or not text.strip():
-            return {
+            result = {
                 'semantic_density': 0.0,
                 'weighted_similarity': 0.0
             }
+            if top_k > 0:
+                result['top_terms'] = []
+            return result
         
         # 获取文本的BERT表示
         text_embedding = self.get_text_embedding(text)
-        
-        # 计算与每个官方话语词向量的余弦相似度
-        similarities = []
-        for official_embedding in self.official_embeddings:
-            similarity = np.dot(text_embedding, official_embedding) / \
-                        (np.linalg.norm(text_embedding) * np.linalg.norm(official_embedding))
-            similarities.append(similarity)
-        
-        # 计算加权平均相似度
-        similarities = np.array(similarities)
-        weighted_similarity = np.sum(similarities * self.official_weights)
+        result = self._score_embedding(text_embedding)
+        if top_k > 0:
+            self._add_top_terms([result], [text_embedding], top_k)
+        return result
+
+    def calculate_semantic_density_batch(self, texts, batch_size=32, top_k=0):
+        """批量计算多个文本的语义浓度
+
+        Args:
+            texts (list): 文本列表
+            batch_size (int): 每次前向计算的文本数
+            top_k (int): 大于0时在结果中加入top_terms
+
+        Returns:
+            list: 与输入顺序一致的分析结果列表，格式同calculate_semantic_density
+        """
+        texts = list(texts)
+        results = [
+            {'semantic_density': 0.0, 'weighted_similarity': 0.0}
+            for _ in texts
+        ]
+        if top_k > 0:
+            for result in results:
+                result['top_terms'] = []
+        valid_indices = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+        if not valid_indices:
+            return results
+
+        embeddings = self.get_text_embeddings([texts[i] for i in valid_indices], batch_size=batch_size)
+        scored = self._score_embeddings(embeddings)
+        if top_k > 0:
+            self._add_top_terms(scored, embeddings, top_k)
+        for i, result in zip(valid_indices, scored):
+            results[i] = result
+        return results
+
+    def _split_windows(self, texts, window_overlap=DEFAULT_WINDOW_OVERLAP):
+        """将文本切分为相互重叠、每个不超过BERT最大长度的token窗口
+
+        Returns:
+            list: 每个文本的窗口列表，窗口为含[CLS]和[SEP]的token id序列
+        """
+        body_length = MAX_SEQUENCE_LENGTH - 2
+        if not 0 <= window_overlap < body_length:
+            raise ValueError(f'window_overlap必须在0到{body_length - 1}之间')
+        stride = body_length - window_overlap
+        cls_id = self.tokenizer.cls_token_id
+        sep_id = self.tokenizer.sep_token_id
+
+        all_windows = []
+        for ids in self._tokenize(list(texts), add_special_tokens=False, verbose=False):
+            starts = range(0, max(len(ids) - window_overlap, 1), stride)
+            all_windows.append([[cls_id] + ids[start:start + body_length] + [sep_id] for start in starts])
+        return all_windows
+
+    def calculate_semantic_density_long(self, texts, pooling='length', window_overlap=DEFAULT_WINDOW_OVERLAP,
+                                        batch_size=128, max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS,
+                                        return_windows=False):
+        """长文档模式的语义浓度
+
+        超过BERT最大长度的文本切分为重叠的窗口，所有文本的所有窗口放在一起
+        按长度分桶批量计算，再把各窗口的相似度汇总为文档的相似度。
+        不超过最大长度的文本只有一个窗口，结果与calculate_semantic_density一致。
+
+        Args:
+            texts (list): 文本列表
+            pooling (str): 窗口汇总方式，'mean'为算术平均，'length'按窗口的token数加权
+            window_overlap (int): 相邻窗口重叠的token数
+            batch_size (int): 每次前向计算最多包含的窗口数
+            max_batch_tokens (int): 每次前向计算最多包含的token数（含填充）
+            return_windows (bool): 是否返回每个窗口的相似度
+
+        Returns:
+            list: 与输入顺序一致的分析结果列表，在calculate_semantic_density结果的基础上
+                增加windows（窗口数），return_windows为True时增加window_similarities
+        """
+        _check_pooling(pooling)
+        texts = list(texts)
+        results = [
+            {'semantic_density': 0.0, 'weighted_similarity': 0.0, 'windows': 0}
+            for _ in texts
+        ]
+        valid_indices = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+        if not valid_indices:
+            return results
+
+        windows_per_text = self._split_windows([texts[i] for i in valid_indices], window_overlap)
+        flat_windows = [window for windows in windows_per_text for window in windows]
+        embeddings = self._embed_token_ids(flat_windows, batch_size=batch_size, max_batch_tokens=max_batch_tokens)
+        similarities = self._weighted_similarities(embeddings)
+
+        offset = 0
+        for i, windows in zip(valid_indices, windows_per_text):
+            window_similarities = similarities[offset:offset + len(windows)]
+            offset += len(windows)
+            results[i] = _pool(window_similarities, [len(window) - 2 for window in windows], pooling)
+            results[i]['windows'] = len(windows)
+            if return_windows:
+                results[i]['window_similarities'] = [float(value) for value in window_similarities]
+        return results
+
+    def calculate_semantic_density_sentences(self, texts, pooling='length', batch_size=32, return_sentences=False):
+        """句子模式的语义浓度
+
+        文本切分为句子，所有文本中不重复的句子先查句子向量缓存，只对未命中的
+        句子批量推理，再把各句的相似度汇总为文档的相似度。
+
+        Args:
+            texts (list): 文本列表
+            pooling (str): 句子汇总方式，'mean'为算术平均，'length'按句子的字数加权
+            batch_size (int): 每次前向计算的句子数
+            return_sentences (bool): 是否返回每个句子的相似度
+
+        Returns:
+            list: 与输入顺序一致的分析结果列表，在calculate_semantic_density结果的基础上
+                增加sentences（句子数），return_sentences为True时增加sentence_similarities
+        """
+        _check_pooling(pooling)
+        texts = list(texts)
+        results = [
+            {'semantic_density': 0.0, 'weighted_similarity': 0.0, 'sentences': 0}
+            for _ in texts
+        ]
+        sentences_per_text = {}
+        for i, text in enumerate(texts):
+            if isinstance(text, str) and text.strip():
+                sentences = split_sentences(text)
+                # 只有标点等切分不出句子的文本与空文本一样保持默认结果
+                if sentences:
+                    sentences_per_text[i] = sentences
+        unique_sentences = list(dict.fromkeys(
+            sentence for sentences in sentences_per_text.values() for sentence in sentences
+        ))
+        if not unique_sentences:
+            return results
+
+        keys = [sentence_key(sentence) for sentence in unique_sentences]
+        vectors = self.sentence_cache.get_many(keys)
+        missing = [j for j, vector in enumerate(vectors) if vector is None]
+        if missing:
+            token_ids = self._tokenize(
+                [unique_sentences[j] for j in missing], truncation=True, max_length=MAX_SEQUENCE_LENGTH
+            )
+            embeddings = self._embed_token_ids(token_ids, batch_size=batch_size)
+            self.sentence_cache.put_many([keys[j] for j in missing], embeddings)
+            for j, embedding in zip(missing, embeddings):
+                vectors[j] = embedding
+
+        similarities = dict(zip(unique_sentences, self._weighted_similarities(np.stack(vectors))))
+        for i, sentences in sentences_per_text.items():
+            sentence_similarities = np.array([similarities[sentence] for sentence in sentences], dtype=np.float32)
+            results[i] = _pool(sentence_similarities, [len(sentence) for sentence in sentences], pooling)
+            results[i]['sentences'] = len(sentences)
+            if return_sentences:
+                results[i]['sentence_similarities'] = [float(value) for value in sentence_similarities]
+        return results
+
+    def load_sentence_cache(self, path):
+        """从磁盘加载句子向量缓存，返回加载的句子数"""
+        return self.sentence_cache.load(path)
+
+    def save_sentence_cache(self, path):
+        """把句子向量缓存保存到磁盘"""
+        self.sentence_cache.save(path)
+
+    def _score_embedding(self, text_embedding):
+        """根据文本向量计算与官方话语词向量的加权相似度"""
+        with stage(self, 'scoring'):
+            text_embedding = np.asarray(text_embedding, dtype=np.float32)
+            text_embedding = text_embedding / max(np.linalg.norm(text_embedding), 1e-12)
+            
+            # 官方话语词向量已归一化，与加权中心向量的点积即为加权平均余弦相似度
+            weighted_similarity = float(text_embedding @ self.official_centroid)
         
         # 将相似度映射到[0,1]区间作为浓度值
         semantic_density = (weighted_similarity + 1) / 2
@@ -117,4 +432,25 @@ class BertBureaucrateseAnalyzer:
         return {
             'semantic_density': semantic_density,
             'weighted_similarity': weighted_similarity
-        }
\ No newline at end of file
+        }
+
+    def _weighted_similarities(self, text_embeddings):
+        """批量计算多个文本向量的加权相似度，一次矩阵-向量乘积完成"""
+        with stage(self, 'scoring'):
+            text_embeddings = np.asarray(text_embeddings, dtype=np.float32)
+            norms = np.linalg.norm(text_embeddings, axis=1, keepdims=True)
+            text_embeddings = text_embeddings / np.maximum(norms, 1e-12)
+            
+            return text_embeddings @ self.official_centroid
+
+    def _score_embeddings(self, text_embeddings):
+        """批量计算多个文本向量的语义浓度"""
+        weighted_similarities = self._weighted_similarities(text_embeddings)
+        
+        return [
+            {
+                'semantic_density': (float(weighted_similarity) + 1) / 2,
+                'weighted_similarity': float(weighted_similarity)
+            }
+            for weighted_similarity in weighted_similarities
+        ]
@@ -0,0 +1,187 @@
+"""按内容寻址的分析结果缓存
+
+新闻语料和API请求中存在大量完全相同的文本（转载的通稿、客户端重复提交），
+缓存以(文本哈希, 分析方法, 词典/模型版本)为键，命中时跳过分词和BERT推理。
+内存层为有界的LRU，可选的SQLite磁盘层在服务重启后仍然有效。磁盘层按写入时间
+淘汰：超过disk_max_age秒的结果和超过disk_maxsize条时最早写入的结果在写入时被清理。
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 磁盘层最多保存的结果数和保存时间，可用环境变量配置
+DEFAULT_DISK_MAXSIZE = int(os.environ.get('BUREAUCRATESE_CACHE_MAX_ROWS', 1000000))
+DEFAULT_DISK_MAX_AGE = float(os.environ.get('BUREAUCRATESE_CACHE_MAX_AGE_DAYS', 30)) * 86400
+# 每写入这么多条结果检查一次是否需要清理，避免每次写入都统计行数
+PRUNE_INTERVAL = 1000
+
+
+def make_cache_key(text, method, version):
+    """生成缓存键
+
+    Args:
+        text (str): 文本
+        method (str): 分析方法
+        version (str): 词典或模型的版本标识，版本变化后旧结果不再命中
+
+    Returns:
+        str: 缓存键
+    """
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return f'{digest}:{method}:{version}'
+
+
+class ResultCache:
+    """内存LRU + 可选SQLite磁盘层的结果缓存
+
+    Args:
+        maxsize (int): 内存层最多保存的结果数，为0时不使用内存层
+        disk_path (str, optional): SQLite数据库路径，为None时不使用磁盘层
+        disk_maxsize (int): 磁盘层最多保存的结果数，为0时不限制
+        disk_max_age (float): 磁盘层结果的保存秒数，为0时不限制
+    """
+
+    def __init__(self, maxsize=10000, disk_path=None, disk_maxsize=DEFAULT_DISK_MAXSIZE,
+                 disk_max_age=DEFAULT_DISK_MAX_AGE):
+        self.maxsize = maxsize
+        self.disk_maxsize = disk_maxsize
+        self.disk_max_age = disk_max_age
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk_path = disk_path
+        self._conn = None
+        self._conn_pid = None
+        # 首次写入时先清理一次，之后每PRUNE_INTERVAL条清理一次
+        self._writes_since_prune = PRUNE_INTERVAL
+
+    def _disk(self):
+        """返回当前进程的磁盘层连接
+
+        连接在首次使用时创建；gunicorn预加载后fork出的工作进程各自重新连接，
+        不共用主进程的SQLite连接。
+        """
+        if self.disk_path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(str(self.disk_path), check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT,
+                    created_at REAL
+                )
+            ''')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(result_cache)')]
+            if 'created_at' not in columns:
+                # 旧版本的缓存表没有写入时间，已有结果视为现在写入
+                conn.execute('ALTER TABLE result_cache ADD COLUMN created_at REAL')
+                conn.execute('UPDATE result_cache SET created_at = ?', (time.time(),))
+            conn.execute('CREATE INDEX IF NOT EXISTS result_cache_created_at ON result_cache (created_at)')
+            conn.commit()
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        """查询缓存，未命中时返回None"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(value)
+
+            conn = self._disk()
+            if conn is not None:
+                row = conn.execute('SELECT value FROM result_cache WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._remember(key, row[0])
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        """保存分析结果"""
+        self.put_many([(key, result)])
+
+    def put_many(self, items):
+        """批量保存分析结果，磁盘层在一个事务中写入
+
+        Args:
+            items (list): (缓存键, 分析结果)列表
+        """
+        rows = [(key, json.dumps(result, ensure_ascii=False)) for key, result in items]
+        if not rows:
+            return
+        with self._lock:
+            for key, value in rows:
+                self._remember(key, value)
+            conn = self._disk()
+            if conn is not None:
+                now = time.time()
+                conn.executemany(
+                    'INSERT OR REPLACE INTO result_cache (key, value, created_at) VALUES (?, ?, ?)',
+                    [(key, value, now) for key, value in rows]
+                )
+                self._writes_since_prune += len(rows)
+                if self._writes_since_prune >= PRUNE_INTERVAL:
+                    self._prune(conn, now)
+                conn.commit()
+
+    def _prune(self, conn, now):
+        """删除过期的结果，以及超出disk_maxsize时最早写入的结果"""
+        self._writes_since_prune = 0
+        if self.disk_max_age > 0:
+            conn.execute('DELETE FROM result_cache WHERE created_at < ?', (now - self.disk_max_age,))
+        if self.disk_maxsize > 0:
+            surplus = conn.execute('SELECT COUNT(*) FROM result_cache').fetchone()[0] - self.disk_maxsize
+            if surplus > 0:
+                conn.execute(
+                    'DELETE FROM result_cache WHERE key IN '
+                    '(SELECT key FROM result_cache ORDER BY created_at LIMIT ?)',
+                    (surplus,)
+                )
+
+    def _remember(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """清空内存层和磁盘层"""
+        with self._lock:
+            self._memory.clear()
+            conn = self._disk()
+            if conn is not None:
+                conn.execute('DELETE FROM result_cache')
+                conn.commit()
+
+    def stats(self):
+        """返回命中和未命中的计数"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'hits': hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_size': len(self._memory),
+                'maxsize': self.maxsize
+            }
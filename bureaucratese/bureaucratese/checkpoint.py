@@ -0,0 +1,182 @@
+"""长时间语料分析的追加式检查点
+
+每批结果写为一个编号的parquet段文件，段文件完整写入并重命名后，
+再向清单文件追加一行记录该段包含的文档ID。保存检查点的开销只与新增的
+行数有关；恢复时只读取清单，已记录的文档ID即为已完成的文档，
+不依赖行数，因此跳过的行也不会导致错位。
+
+进程在任意时刻崩溃都不会破坏已提交的数据：未写入清单的段文件在下次
+打开时被清理，清单末尾不完整的一行被忽略。
+"""
+import os
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .fileutils import atomic_write
+
+MANIFEST_NAME = '_manifest.jsonl'
+
+
+def _encode_value(value):
+    """把单个非整数ID编码为带类型标记的JSON值，恢复时还原为原类型"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return ['b', value]
+    if isinstance(value, int):
+        return ['i', value]
+    if isinstance(value, float):
+        return ['f', value]
+    if isinstance(value, str):
+        return ['s', value]
+    if isinstance(value, pd.Timestamp):
+        return ['t', value.isoformat()]
+    raise TypeError(f"不支持的文档ID类型: {type(value).__name__}")
+
+
+_DECODERS = {
+    'b': bool,
+    'i': int,
+    'f': float,
+    's': str,
+    't': pd.Timestamp
+}
+
+
+def _encode_ids(ids):
+    """整数ID压缩为连续区间列表，其他类型的ID带类型标记保存"""
+    ids = [i.item() if isinstance(i, np.generic) else i for i in ids]
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return {'values': [_encode_value(i) for i in ids]}
+    ranges = []
+    for i in sorted(ids):
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return {'ranges': ranges}
+
+
+def _decode_ids(entry):
+    if 'ranges' in entry:
+        for start, end in entry['ranges']:
+            yield from range(start, end + 1)
+    elif 'values' in entry:
+        for tag, value in entry['values']:
+            yield _DECODERS[tag](value)
+    else:
+        # 旧版本的清单把非整数ID保存为字符串
+        yield from entry['ids']
+
+
+def _parse_manifest(manifest_path):
+    """读取清单中完整的记录，返回(记录列表, 完整记录占用的字节数)"""
+    entries = []
+    valid_bytes = 0
+    if not manifest_path.exists():
+        return entries, valid_bytes
+    with open(manifest_path, 'rb') as f:
+        for line in f:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('incomplete line')
+                entries.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                break
+            valid_bytes += len(line)
+    return entries, valid_bytes
+
+
+def committed_segments(checkpoint_dir):
+    """只读地返回已提交的段文件路径
+
+    与CheckpointStore不同，不修改清单也不清理未提交的段，
+    可以在另一个进程仍在写入时读取已完成的结果。
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    entries, _ = _parse_manifest(checkpoint_dir / MANIFEST_NAME)
+    return [checkpoint_dir / entry['file'] for entry in entries]
+
+
+class CheckpointStore:
+    """由编号段文件和清单组成的检查点目录
+
+    目录中的段文件可以直接用 pd.read_parquet(checkpoint_dir) 读取。
+
+    Args:
+        checkpoint_dir (str): 检查点目录
+    """
+
+    def __init__(self, checkpoint_dir):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.checkpoint_dir / MANIFEST_NAME
+        self.entries = self._read_manifest()
+        self._next_segment = max((entry['segment'] for entry in self.entries), default=-1) + 1
+        self._remove_uncommitted()
+
+    def _read_manifest(self):
+        entries, valid_bytes = _parse_manifest(self.manifest_path)
+        # 截掉写入清单时崩溃留下的不完整行，之后的追加才能被正确读取
+        if self.manifest_path.exists() and valid_bytes < self.manifest_path.stat().st_size:
+            with open(self.manifest_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return entries
+
+    def _remove_uncommitted(self):
+        committed = {entry['file'] for entry in self.entries}
+        for path in self.checkpoint_dir.glob('segment-*.parquet'):
+            if path.name not in committed:
+                path.unlink()
+        for path in self.checkpoint_dir.glob('.segment-*.tmp'):
+            path.unlink()
+
+    def completed_ids(self):
+        """返回所有已提交的文档ID"""
+        completed = set()
+        for entry in self.entries:
+            completed.update(_decode_ids(entry))
+        return completed
+
+    @property
+    def completed_count(self):
+        return sum(entry['rows'] for entry in self.entries)
+
+    def write_segment(self, df):
+        """原子地写入一个新段并追加到清单
+
+        Args:
+            df (pd.DataFrame): 本段结果，索引为文档ID
+
+        Returns:
+            int: 段编号
+        """
+        segment = self._next_segment
+        name = f'segment-{segment:06d}.parquet'
+        path = self.checkpoint_dir / name
+        # 段文件及其目录项落盘后才写清单，断电后清单不会指向不存在的段
+        with atomic_write(path, durable=True) as tmp_path:
+            df.to_parquet(tmp_path, index=True)
+
+        entry = {'segment': segment, 'file': name, 'rows': len(df)}
+        entry.update(_encode_ids(df.index.tolist()))
+        with open(self.manifest_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.entries.append(entry)
+        self._next_segment += 1
+        return segment
+
+    def segment_paths(self):
+        """按编号顺序返回已提交的段文件"""
+        return [self.checkpoint_dir / entry['file'] for entry in self.entries]
+
+    def read(self, columns=None):
+        """读取所有已提交的结果"""
+        paths = self.segment_paths()
+        if not paths:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pd.read_parquet(path, columns=columns) for path in paths])
@@ -0,0 +1,134 @@
+"""大规模语料的流式读取与分批分析
+
+按批读取parquet、CSV或JSONL文件中需要的列，逐批分析后由checkpoint.CheckpointStore追加写入parquet段文件，
+峰值内存只取决于批大小，而与语料总量无关。
+"""
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+DEFAULT_BATCH_SIZE = 10000
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+# 统计CSV记录数时每次解析的行数
+COUNT_CHUNK_SIZE = 100000
+
+
+def list_columns(file_path):
+    """返回parquet、CSV或JSONL文件的列名，不读取数据（JSONL只读取第一条记录）"""
+    suffix = Path(file_path).suffix.lower()
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file_path).schema_arrow.names
+    if suffix == '.csv':
+        return pd.read_csv(file_path, nrows=0).columns.tolist()
+    if suffix in JSONL_SUFFIXES:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    return list(json.loads(line))
+        return []
+    raise ValueError(f"不支持的文件格式: {suffix}")
+
+
+def count_rows(file_path):
+    """返回文件的记录数（不含CSV表头），parquet直接读取元数据
+
+    CSV的一条记录可能包含带引号的多行正文，因此用CSV解析器逐块计数，只读取第一列。
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(file_path).metadata.num_rows
+    if suffix in JSONL_SUFFIXES:
+        with open(file_path, 'rb') as f:
+            return sum(1 for line in f if line.strip())
+    return sum(len(chunk) for chunk in pd.read_csv(file_path, usecols=[0], chunksize=COUNT_CHUNK_SIZE))
+
+
+def iter_record_batches(file_path, columns=None, batch_size=DEFAULT_BATCH_SIZE):
+    """按批读取parquet、CSV或JSONL文件
+
+    Args:
+        file_path (str): 文件路径
+        columns (list, optional): 需要读取的列，默认读取全部列
+        batch_size (int): 每批的行数
+
+    Yields:
+        tuple: (该批第一行在文件中的行号, pd.DataFrame)
+    """
+    suffix = Path(file_path).suffix.lower()
+    start_row = 0
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(file_path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            df = batch.to_pandas()
+            df.index = pd.RangeIndex(start_row, start_row + len(df))
+            yield start_row, df
+            start_row += len(df)
+    elif suffix == '.csv':
+        for df in pd.read_csv(file_path, usecols=columns, chunksize=batch_size):
+            df.index = pd.RangeIndex(start_row, start_row + len(df))
+            yield start_row, df
+            start_row += len(df)
+    elif suffix in JSONL_SUFFIXES:
+        for df in pd.read_json(file_path, lines=True, chunksize=batch_size, dtype=False):
+            if columns is not None:
+                df = df.reindex(columns=columns)
+            df.index = pd.RangeIndex(start_row, start_row + len(df))
+            yield start_row, df
+            start_row += len(df)
+    else:
+        raise ValueError(f"不支持的文件格式: {suffix}")
+
+
+def analyze_batch(texts, analyzer, bert_analyzer=None, semantic_batch_size=32):
+    """分析一批文本
+
+    基础和加权密度共用一次分词，语义密度对整批文本做批量推理。
+    空文本的结果为0，官方话语列为空字符串。
+
+    Args:
+        texts (pd.Series): 文本
+        analyzer (BureaucrateseAnalyzer): 分析器
+        bert_analyzer (BertBureaucrateseAnalyzer, optional): BERT分析器，为None时不计算语义密度
+        semantic_batch_size (int): 语义分析每次前向计算的文本数
+
+    Returns:
+        pd.DataFrame: 与texts索引一致的分析结果
+    """
+    n = len(texts)
+    basic_density = np.zeros(n, dtype=np.float64)
+    weighted_density = np.zeros(n, dtype=np.float64)
+    semantic_density = np.zeros(n, dtype=np.float64)
+    official_words = [''] * n
+
+    valid_positions = []
+    valid_texts = []
+    for position, text in enumerate(texts):
+        if not isinstance(text, str) or not text.strip():
+            continue
+        try:
+            multi_result = analyzer.analyze_text_multi(text, modes=('basic', 'weighted'))
+        except Exception as e:
+            print(f"处理第{texts.index[position]}行时出错：{str(e)}")
+            continue
+        basic_density[position] = multi_result['basic']['density']
+        weighted_density[position] = multi_result['weighted']['weighted_density']
+        official_words[position] = ', '.join(multi_result['basic']['official_words'])
+        valid_positions.append(position)
+        valid_texts.append(text)
+
+    if bert_analyzer is not None and valid_texts:
+        semantic_results = bert_analyzer.calculate_semantic_density_batch(valid_texts, batch_size=semantic_batch_size)
+        for position, semantic_result in zip(valid_positions, semantic_results):
+            semantic_density[position] = semantic_result['semantic_density']
+
+    return pd.DataFrame({
+        'basic_density': basic_density,
+        'weighted_density': weighted_density,
+        'semantic_density': semantic_density,
+        'official_words': official_words
+    }, index=texts.index)
+
@@ -0,0 +1,246 @@
+"""官方话语词典的编译与加载
+
+解析词典CSV、向jieba逐个添加词语以及jieba首次分词时构建前缀词典，
+是分析器启动时最耗时的部分。编译步骤把词语集合、词语类型、词频以及
+可直接载入jieba的前缀词典保存为一个二进制文件，之后的启动只需读取该文件。
+文件以CSV内容的哈希命名，CSV修改后会自动重新编译。
+
+每个词典对应一个独立的jieba.Tokenizer实例，按词典哈希在进程内共享，
+不修改jieba的全局分词器，同一进程中可以同时使用多个不同的词典。
+编译后的词典同样按哈希在进程内共享，前缀词典载入分词器后只由分词器持有。
+"""
+import sys
+import threading
+import marshal
+import hashlib
+from pathlib import Path
+import pandas as pd
+import jieba
+from .fileutils import atomic_write
+
+# 编译文件格式版本，格式变化时旧文件自动失效
+COMPILED_FORMAT_VERSION = 1
+
+DEFAULT_DICT_PATH = Path(__file__).parent / '../data/RAWdataset.csv'
+DEFAULT_CACHE_DIR = Path(__file__).parent / 'preprocessed'
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+class CompiledDictionary:
+    """编译后的官方话语词典
+
+    Attributes:
+        source_hash (str): 词典CSV内容的哈希
+        official_words (set): 官方话语词语集合
+        official_word_list (list): 按CSV顺序排列的官方话语词语
+        word_types (dict): 词语到类型的映射
+        word_frequencies (dict): 词语到词频的映射
+        prefix_freq (dict): 可直接载入jieba的前缀词典，载入分词器后为None
+        prefix_total (int): 前缀词典的总词频
+    """
+
+    def __init__(self, source_hash, official_word_list, word_types, word_frequencies, prefix_freq, prefix_total):
+        self.source_hash = source_hash
+        self.official_word_list = official_word_list
+        self.official_words = set(official_word_list)
+        self.word_types = word_types
+        self.word_frequencies = word_frequencies
+        self.prefix_freq = prefix_freq
+        self.prefix_total = prefix_total
+
+    def install(self, tokenizer):
+        """将前缀词典载入jieba分词器，跳过jieba自身的词典构建
+
+        前缀词典交给分词器持有，词典本身不再保留，每个词典只能载入一次。
+
+        Args:
+            tokenizer (jieba.Tokenizer): 目标分词器
+        """
+        if self.prefix_freq is None:
+            raise RuntimeError('前缀词典已载入其他分词器')
+        with tokenizer.lock:
+            tokenizer.FREQ = self.prefix_freq
+            tokenizer.total = self.prefix_total
+            tokenizer.initialized = True
+        self.prefix_freq = None
+
+    def _to_tuple(self):
+        return (
+            COMPILED_FORMAT_VERSION,
+            self.source_hash,
+            self.official_word_list,
+            self.word_types,
+            self.word_frequencies,
+            self.prefix_freq,
+            self.prefix_total
+        )
+
+
+def _artifact_key(source_hash):
+    """编译文件的键同时包含jieba和Python版本，二者变化时重新编译"""
+    jieba_version = getattr(jieba, '__version__', 'unknown')
+    key = f"{COMPILED_FORMAT_VERSION}:{source_hash}:{jieba_version}:{sys.version_info[0]}.{sys.version_info[1]}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def file_hash(path):
+    """计算文件内容的sha256哈希"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compile_dictionary(custom_dict_path=None, source_hash=None):
+    """解析词典CSV并构建前缀词典
+
+    Args:
+        custom_dict_path (str, optional): 自定义词典路径
+        source_hash (str, optional): 词典CSV的哈希，未提供时自动计算
+
+    Returns:
+        CompiledDictionary: 编译后的词典
+    """
+    custom_dict_path = custom_dict_path if custom_dict_path is not None else DEFAULT_DICT_PATH
+    if source_hash is None:
+        source_hash = file_hash(custom_dict_path)
+
+    df = pd.read_csv(custom_dict_path)
+    # 只保留官方话语的词
+    official_word_list = df[df['typeOfWord'] == '官方话语']['Word'].tolist()
+    word_types = dict(zip(df['Word'].tolist(), df['typeOfWord'].tolist()))
+    word_frequencies = dict(zip(df['Word'].tolist(), df['Frequency'].tolist()))
+
+    # 在独立的分词器上构建前缀词典：先加载jieba默认词典，再加入词典中的词语并设置词频
+    tokenizer = jieba.Tokenizer()
+    tokenizer.initialize()
+    for word in df['Word']:
+        tokenizer.add_word(word)
+    for word, freq in zip(df['Word'], df['Frequency']):
+        tokenizer.add_word(word, freq=freq)
+
+    prefix_freq = {word: int(freq) for word, freq in tokenizer.FREQ.items()}
+    return CompiledDictionary(
+        source_hash,
+        official_word_list,
+        word_types,
+        word_frequencies,
+        prefix_freq,
+        int(tokenizer.total)
+    )
+
+
+def get_tokenizer(dictionary):
+    """获取载入了该词典的jieba分词器
+
+    相同内容的词典共享同一个分词器实例，不同词典之间互不影响。
+
+    Args:
+        dictionary (CompiledDictionary): 编译后的词典
+
+    Returns:
+        jieba.Tokenizer: 分词器实例
+    """
+    tokenizer = _tokenizers.get(dictionary.source_hash)
+    if tokenizer is not None:
+        return tokenizer
+
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(dictionary.source_hash)
+        if tokenizer is None:
+            tokenizer = jieba.Tokenizer()
+            dictionary.install(tokenizer)
+            _tokenizers[dictionary.source_hash] = tokenizer
+    return tokenizer
+
+
+def load_dictionary(custom_dict_path=None, cache_dir=None, use_cache=True):
+    """加载编译后的词典，编译文件不存在或CSV已修改时重新编译
+
+    同一进程中内容相同的词典只加载一次，各分析器共享同一个实例。
+
+    Args:
+        custom_dict_path (str, optional): 自定义词典路径
+        cache_dir (str, optional): 编译文件目录，默认为包内的preprocessed目录
+        use_cache (bool): 是否使用进程内共享的实例，为False时总是重新读取编译文件
+
+    Returns:
+        CompiledDictionary: 编译后的词典
+    """
+    custom_dict_path = custom_dict_path if custom_dict_path is not None else DEFAULT_DICT_PATH
+    source_hash = file_hash(custom_dict_path)
+    if not use_cache:
+        return _load_compiled(custom_dict_path, cache_dir, source_hash)
+
+    dictionary = _dictionaries.get(source_hash)
+    if dictionary is not None:
+        return dictionary
+    with _dictionaries_lock:
+        dictionary = _dictionaries.get(source_hash)
+        if dictionary is None:
+            dictionary = _load_compiled(custom_dict_path, cache_dir, source_hash)
+            _dictionaries[source_hash] = dictionary
+    return dictionary
+
+
+def load_vocabulary(custom_dict_path=None, cache_dir=None):
+    """只加载语义分析所需的官方话语词语及其词频
+
+    进程内已加载该词典时直接取用共享的实例；否则读取编译文件后只保留词表，
+    前缀词典随即释放，不会常驻内存。
+
+    Args:
+        custom_dict_path (str, optional): 自定义词典路径
+        cache_dir (str, optional): 编译文件目录
+
+    Returns:
+        tuple: (词典哈希, 按CSV顺序排列的官方话语词语列表, 官方话语词语到词频的映射)
+    """
+    custom_dict_path = custom_dict_path if custom_dict_path is not None else DEFAULT_DICT_PATH
+    source_hash = file_hash(custom_dict_path)
+    dictionary = _dictionaries.get(source_hash)
+    if dictionary is None:
+        dictionary = _load_compiled(custom_dict_path, cache_dir, source_hash)
+    word_frequencies = {word: dictionary.word_frequencies[word] for word in dictionary.official_word_list
+                        if word in dictionary.word_frequencies}
+    return dictionary.source_hash, dictionary.official_word_list, word_frequencies
+
+
+def _load_compiled(custom_dict_path, cache_dir, source_hash):
+    cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+    artifact_path = cache_dir / f'dictionary-{_artifact_key(source_hash)}.bin'
+
+    if artifact_path.exists():
+        try:
+            with open(artifact_path, 'rb') as f:
+                data = marshal.load(f)
+            if data[0] == COMPILED_FORMAT_VERSION and data[1] == source_hash:
+                return CompiledDictionary(*data[1:])
+        except (EOFError, ValueError, TypeError, IndexError):
+            pass
+
+    dictionary = compile_dictionary(custom_dict_path, source_hash=source_hash)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with atomic_write(artifact_path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                marshal.dump(dictionary._to_tuple(), f)
+    except OSError as e:
+        print(f"警告：无法保存编译后的词典到 {artifact_path}: {str(e)}")
+    return dictionary
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='编译官方话语词典')
+    parser.add_argument('dict_path', nargs='?', default=None, help='词典CSV路径，默认为内置词典')
+    args = parser.parse_args()
+
+    dictionary = load_dictionary(args.dict_path)
+    print(f"词典编译完成，共 {len(dictionary.word_types)} 个词语，其中官方话语 {len(dictionary.official_words)} 个")
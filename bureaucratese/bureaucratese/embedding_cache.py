@@ -0,0 +1,125 @@
+"""句子级BERT向量缓存
+
+新闻中大量句子在不同文章间重复出现：固定的导语、政策口号、法律声明等。
+句子模式把文本切分为句子，以句子内容的哈希为键缓存其[CLS]向量，
+只对未命中的句子做推理。缓存为有界的LRU，可以保存到磁盘并在下次启动时加载；
+保存的文件记录了推理后端的标识，模型或后端变化后旧的缓存不会被加载。
+"""
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+from .fileutils import atomic_write
+
+DEFAULT_SENTENCE_CACHE_SIZE = 20000
+
+# 句末标点（连同其后的引号、括号）与所在句子保留在一起
+_SENTENCE_RE = re.compile(r'[^。！？!?；;\n]+(?:[。！？!?；;]+[”’」』）)]*)?')
+
+
+def split_sentences(text):
+    """按句末标点和换行切分句子，去掉首尾空白和空句"""
+    return [sentence.strip() for sentence in _SENTENCE_RE.findall(text) if sentence.strip()]
+
+
+def sentence_key(sentence):
+    return hashlib.sha1(sentence.encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """以句子哈希为键的有界LRU向量缓存
+
+    Args:
+        maxsize (int): 最多缓存的句子数
+        namespace (str): 向量所属的模型和推理后端标识，保存和加载时校验
+    """
+
+    def __init__(self, maxsize=DEFAULT_SENTENCE_CACHE_SIZE, namespace=''):
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def get_many(self, keys):
+        """批量查询，返回与keys等长的列表，未命中的位置为None"""
+        vectors = []
+        with self._lock:
+            for key in keys:
+                vector = self._vectors.get(key)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    self._vectors.move_to_end(key)
+                    self.hits += 1
+                vectors.append(vector)
+        return vectors
+
+    def put_many(self, keys, vectors):
+        """批量写入，超出容量时淘汰最久未使用的句子"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._vectors[key] = np.asarray(vector, dtype=np.float32)
+                self._vectors.move_to_end(key)
+            while len(self._vectors) > self.maxsize:
+                self._vectors.popitem(last=False)
+
+    def save(self, path):
+        """原子地保存为npz文件"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            keys = list(self._vectors)
+            matrix = np.stack([self._vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        with atomic_write(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez(
+                    f,
+                    keys=np.frombuffer(b''.join(keys), dtype=np.uint8).reshape(len(keys), 20),
+                    vectors=matrix,
+                    namespace=np.array(self.namespace)
+                )
+
+    def load(self, path):
+        """加载之前保存的缓存
+
+        Returns:
+            int: 加载的句子数；文件不存在或标识不一致时为0
+        """
+        path = Path(path)
+        if not path.exists():
+            return 0
+        try:
+            with np.load(path) as data:
+                if str(data['namespace']) != self.namespace:
+                    print(f"句子向量缓存 {path} 属于其他模型或推理后端，已忽略")
+                    return 0
+                keys = [row.tobytes() for row in data['keys']]
+                vectors = data['vectors']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"读取句子向量缓存 {path} 失败：{str(e)}")
+            return 0
+        # 文件中越靠后的句子越近使用，只保留容量范围内最近的部分
+        start = max(len(keys) - self.maxsize, 0)
+        self.put_many(keys[start:], vectors[start:])
+        return len(keys) - start
+
+    def stats(self):
+        """返回命中和未命中的计数"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._vectors),
+                'maxsize': self.maxsize
+            }
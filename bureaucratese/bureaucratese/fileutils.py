@@ -0,0 +1,57 @@
+"""文件写入工具
+
+缓存、检查点和指标快照都先写入同一目录下的临时文件再重命名，
+其他进程只会看到完整的旧文件或新文件，不会读到写了一半的内容。
+"""
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def fsync_dir(path):
+    """把目录项的修改（新建、重命名）写入磁盘，Windows不支持打开目录时跳过"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path, durable=False):
+    """返回临时路径，with块正常结束后把它原子地重命名为path
+
+    临时路径与path在同一目录，以进程号和线程号区分，可以写入文件或目录；
+    with块出错时删除临时文件并重新抛出异常，path保持不变。
+
+    Args:
+        path (str | Path): 目标路径
+        durable (bool): 是否在重命名前后调用fsync，断电后仍能看到完整的新文件
+
+    Yields:
+        Path: 临时路径
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        yield tmp_path
+        if durable and tmp_path.is_file():
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.is_dir():
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+        raise
+    if durable:
+        fsync_dir(path.parent)
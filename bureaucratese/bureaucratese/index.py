@@ -0,0 +1,141 @@
+"""官方话语词向量的近邻索引
+
+用于解释语义浓度：对每个文本找出最相近的k个官方话语词语。词表较小时直接
+做一次矩阵-向量乘积；词表较大时使用倒排文件索引（IVF）：先用球面k均值把
+词向量划分为若干簇，查询时只在与文本最相近的n_probe个簇中精确计算相似度，
+查询开销约为 n_lists + N * n_probe / n_lists 次点积，而不是N次。
+
+索引按词向量的版本标识缓存在preprocessed目录中，只在第一次使用时构建。
+"""
+import numpy as np
+from pathlib import Path
+
+from .preprocess_embeddings import DEFAULT_CACHE_DIR
+from .fileutils import atomic_write
+
+# 词表不超过该大小时直接精确计算
+EXACT_SEARCH_THRESHOLD = 8192
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 10
+# 构建簇中心时最多使用的样本数
+KMEANS_SAMPLE_SIZE = 50000
+
+
+def _spherical_kmeans(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """对已归一化的向量做球面k均值，返回归一化的簇中心"""
+    rng = np.random.RandomState(seed)
+    sample = vectors
+    if len(vectors) > KMEANS_SAMPLE_SIZE:
+        sample = vectors[rng.choice(len(vectors), KMEANS_SAMPLE_SIZE, replace=False)]
+    centroids = np.array(sample[rng.choice(len(sample), n_lists, replace=False)], dtype=np.float32)
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = sample[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # 空簇重新取一个随机样本作为中心
+                centroids[c] = sample[rng.randint(len(sample))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def _assign(vectors, centroids, block_size=16384):
+    """分块计算每个向量所属的簇，避免一次生成N×n_lists的大矩阵"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+class OfficialTermIndex:
+    """官方话语词向量的top-k近邻索引
+
+    Args:
+        embeddings (np.ndarray): 已L2归一化的词向量矩阵，形状为(N, hidden_size)
+        words (list): 与embeddings各行对应的词语
+        n_lists (int, optional): IVF的簇数，默认为sqrt(N)；为0时总是精确计算
+        n_probe (int): 查询时搜索的簇数
+        cache_key (str, optional): 词向量的版本标识，提供时把构建好的索引缓存到cache_dir
+        cache_dir (str, optional): 索引缓存目录
+    """
+
+    def __init__(self, embeddings, words, n_lists=None, n_probe=DEFAULT_N_PROBE, cache_key=None, cache_dir=None):
+        self.embeddings = embeddings
+        self.words = list(words)
+        self.n_probe = n_probe
+
+        n = len(self.words)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n)) if n > EXACT_SEARCH_THRESHOLD else 0
+        self.n_lists = min(n_lists, n)
+        self.centroids = None
+        if self.n_lists > 0:
+            self._load_or_build(cache_key, cache_dir)
+
+    def _load_or_build(self, cache_key, cache_dir):
+        path = None
+        if cache_key is not None:
+            cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+            path = cache_dir / f'ivf-{cache_key}-{self.n_lists}.npz'
+            if path.exists():
+                with np.load(path) as data:
+                    self.centroids = data['centroids']
+                    self.order = data['order']
+                    self.offsets = data['offsets']
+                return
+
+        print(f"构建官方话语近邻索引（{len(self.words)}个词，{self.n_lists}个簇）...")
+        self.centroids = _spherical_kmeans(np.asarray(self.embeddings, dtype=np.float32), self.n_lists)
+        assignments = _assign(self.embeddings, self.centroids)
+        # 同一簇的词连续存放，offsets[c]:offsets[c+1]为第c个簇的成员在order中的位置
+        self.order = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))]).astype(np.int64)
+
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_write(path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, centroids=self.centroids, order=self.order, offsets=self.offsets)
+
+    def _candidates(self, query):
+        if self.centroids is None:
+            return None
+        n_probe = min(self.n_probe, self.n_lists)
+        probes = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+
+    def search(self, queries, k=10):
+        """查询每个向量最相近的k个词语
+
+        Args:
+            queries (np.ndarray): 已L2归一化的查询向量，形状为(M, hidden_size)
+            k (int): 返回的词语数
+
+        Returns:
+            list: 每个查询的[{'word': 词语, 'similarity': 余弦相似度}]，按相似度降序排列
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        results = []
+        for query in queries:
+            candidates = self._candidates(query)
+            if candidates is None:
+                similarities = self.embeddings @ query
+                indices = np.arange(len(similarities))
+            else:
+                # 按行号顺序读取，内存映射的词向量矩阵因此近似顺序访问
+                indices = np.sort(candidates)
+                similarities = self.embeddings[indices] @ query
+            top_k = min(k, len(similarities))
+            if top_k <= 0:
+                results.append([])
+                continue
+            top = np.argpartition(-similarities, top_k - 1)[:top_k]
+            top = top[np.argsort(-similarities[top])]
+            results.append([
+                {'word': self.words[indices[i]], 'similarity': float(similarities[i])}
+                for i in top
+            ])
+        return results
@@ -0,0 +1,268 @@
+"""BERT推理后端
+
+语义分析只需要BERT最后一层的[CLS]向量。推理后端把这一计算封装为统一的接口，
+分析器通过构造参数选择：
+
+- eager: 直接调用PyTorch的BertModel
+- torchscript: 用torch.jit.trace导出的TorchScript模型，省去Python层的调度开销
+- onnx: 导出为ONNX后由ONNX Runtime在CPU上执行（需要安装onnxruntime）
+
+torchscript和onnx可以同时启用动态int8量化，全连接层的权重以int8保存和计算，
+在没有GPU的服务器上通常能显著缩短推理时间，结果与原模型略有偏差，
+上线前应用check_parity在样本文本上确认偏差在可接受范围内。
+
+导出的模型按模型指纹缓存在preprocessed目录中，只在第一次使用时导出。
+"""
+import time
+import numpy as np
+import torch
+from pathlib import Path
+
+from .preprocess_embeddings import DEFAULT_CACHE_DIR
+from .fileutils import atomic_write
+
+BACKENDS = ('eager', 'torchscript', 'onnx')
+ONNX_OPSET = 14
+DEFAULT_PARITY_TOLERANCE = 0.01
+
+
+class _ClsEncoder(torch.nn.Module):
+    """只输出[CLS]向量的BertModel封装，供导出使用"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        outputs = self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)
+        return outputs.last_hidden_state[:, 0, :]
+
+
+def _example_inputs(batch_size=2, seq_len=16):
+    input_ids = torch.ones((batch_size, seq_len), dtype=torch.long)
+    return input_ids, torch.ones_like(input_ids), torch.zeros_like(input_ids)
+
+
+def _cpu_model(model, owned=False):
+    """返回位于CPU上的模型，不移动传入的模型
+
+    注册表中的分析器共享同一个模型，导出和量化都不能改变它所在的设备。
+    模型已在CPU上且不需要独占时直接返回原模型（导出只读取权重）；否则按配置
+    新建一个模型，在CPU上载入权重，不在GPU上产生额外的副本。
+
+    Args:
+        model: BertModel
+        owned (bool): 调用方是否会修改返回的模型（如原地量化），为True时总是返回副本
+    """
+    on_cpu = all(parameter.device.type == 'cpu' for parameter in model.parameters())
+    if on_cpu and not owned:
+        return model
+    config = getattr(model, 'config', None)
+    if config is None:
+        import copy
+        return copy.deepcopy(model).cpu()
+    copied = type(model)(config)
+    copied.load_state_dict({name: tensor.cpu() for name, tensor in model.state_dict().items()})
+    return copied.eval()
+
+
+def _quantize(model):
+    """对模型的全连接层原地做动态int8量化，模型应为调用方独占的CPU副本"""
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _artifact_path(cache_dir, backend, model_key, quantize, suffix):
+    cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    variant = '-int8' if quantize else ''
+    return cache_dir / f'{backend}-{model_key[:16]}{variant}{suffix}'
+
+
+class EagerBackend:
+    """直接调用PyTorch模型"""
+
+    name = 'eager'
+
+    def __init__(self, model, device, quantize=False):
+        self.device = device
+        self.encoder = _ClsEncoder(_quantize(_cpu_model(model, owned=True)) if quantize else model)
+        if quantize:
+            # 量化后的模型只能在CPU上运行
+            self.device = torch.device('cpu')
+        self.encoder.eval()
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        with torch.no_grad():
+            outputs = self.encoder(
+                input_ids.to(self.device),
+                attention_mask.to(self.device),
+                token_type_ids.to(self.device)
+            )
+        return outputs.cpu().numpy()
+
+
+class TorchScriptBackend:
+    """执行torch.jit.trace导出的模型"""
+
+    name = 'torchscript'
+
+    def __init__(self, model, device, model_key, quantize=False, cache_dir=None):
+        self.device = torch.device('cpu') if quantize else device
+        path = _artifact_path(cache_dir, self.name, model_key, quantize, '.pt')
+        if not path.exists():
+            print(f"导出TorchScript模型到 {path}...")
+            cpu_model = _cpu_model(model, owned=quantize)
+            encoder = _ClsEncoder(_quantize(cpu_model) if quantize else cpu_model).eval()
+            with torch.no_grad():
+                traced = torch.jit.trace(encoder, _example_inputs(), strict=False)
+            with atomic_write(path) as tmp_path:
+                torch.jit.save(traced, str(tmp_path))
+        self.module = torch.jit.load(str(path), map_location=self.device)
+        self.module.eval()
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        with torch.no_grad():
+            outputs = self.module(
+                input_ids.to(self.device),
+                attention_mask.to(self.device),
+                token_type_ids.to(self.device)
+            )
+        return outputs.cpu().numpy()
+
+
+class OnnxBackend:
+    """由ONNX Runtime执行导出的ONNX模型"""
+
+    name = 'onnx'
+
+    def __init__(self, model, device, model_key, quantize=False, cache_dir=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnx后端需要安装onnxruntime: pip install onnxruntime")
+
+        path = _artifact_path(cache_dir, self.name, model_key, quantize, '.onnx')
+        if not path.exists():
+            fp32_path = _artifact_path(cache_dir, self.name, model_key, False, '.onnx')
+            if not fp32_path.exists():
+                print(f"导出ONNX模型到 {fp32_path}...")
+                encoder = _ClsEncoder(_cpu_model(model)).eval()
+                dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in ('input_ids', 'attention_mask', 'token_type_ids')}
+                dynamic_axes['cls'] = {0: 'batch'}
+                with torch.no_grad(), atomic_write(fp32_path) as tmp_path:
+                    torch.onnx.export(
+                        encoder,
+                        _example_inputs(),
+                        str(tmp_path),
+                        input_names=['input_ids', 'attention_mask', 'token_type_ids'],
+                        output_names=['cls'],
+                        dynamic_axes=dynamic_axes,
+                        opset_version=ONNX_OPSET
+                    )
+            if quantize:
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                print(f"量化ONNX模型到 {path}...")
+                with atomic_write(path) as tmp_path:
+                    quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(path), options, providers=['CPUExecutionProvider'])
+
+    def __call__(self, input_ids, attention_mask, token_type_ids):
+        outputs = self.session.run(['cls'], {
+            'input_ids': input_ids.numpy(),
+            'attention_mask': attention_mask.numpy(),
+            'token_type_ids': token_type_ids.numpy()
+        })
+        return outputs[0]
+
+
+def create_backend(backend, model, device, model_key, quantize=False, cache_dir=None):
+    """创建推理后端
+
+    Args:
+        backend (str): 'eager'、'torchscript'或'onnx'
+        model: 已加载的BertModel
+        device (torch.device): 运行设备，量化模型和onnx后端总是在CPU上运行
+        model_key (str): 模型指纹，用于缓存导出的模型
+        quantize (bool): 是否做动态int8量化
+        cache_dir (str, optional): 导出模型的缓存目录
+
+    Returns:
+        可调用对象，接收input_ids、attention_mask、token_type_ids张量，
+        返回形状为(batch, hidden_size)的numpy数组
+    """
+    if backend == 'eager':
+        return EagerBackend(model, device, quantize=quantize)
+    if backend == 'torchscript':
+        return TorchScriptBackend(model, device, model_key, quantize=quantize, cache_dir=cache_dir)
+    if backend == 'onnx':
+        return OnnxBackend(model, device, model_key, quantize=quantize, cache_dir=cache_dir)
+    raise ValueError(f"推理后端必须为{', '.join(BACKENDS)}之一")
+
+
+def check_parity(reference, candidate, texts, tolerance=DEFAULT_PARITY_TOLERANCE, batch_size=32):
+    """比较两个分析器在同一批文本上的语义浓度
+
+    Args:
+        reference (BertBureaucrateseAnalyzer): 作为基准的分析器，通常为eager后端
+        candidate (BertBureaucrateseAnalyzer): 待检查的分析器
+        texts (list): 样本文本
+        tolerance (float): 允许的semantic_density最大绝对误差
+        batch_size (int): 每次前向计算的文本数
+
+    Returns:
+        dict: 包括样本数、最大和平均绝对误差、是否通过以及两者的耗时
+    """
+    texts = [text for text in texts if isinstance(text, str) and text.strip()]
+
+    start = time.perf_counter()
+    expected = reference.calculate_semantic_density_batch(texts, batch_size=batch_size)
+    reference_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = candidate.calculate_semantic_density_batch(texts, batch_size=batch_size)
+    candidate_seconds = time.perf_counter() - start
+
+    errors = np.array([
+        abs(a['semantic_density'] - e['semantic_density'])
+        for a, e in zip(actual, expected)
+    ], dtype=np.float64)
+    max_error = float(errors.max()) if len(errors) else 0.0
+    return {
+        'samples': len(texts),
+        'max_absolute_error': max_error,
+        'mean_absolute_error': float(errors.mean()) if len(errors) else 0.0,
+        'tolerance': tolerance,
+        'passed': max_error <= tolerance,
+        'reference_seconds': reference_seconds,
+        'candidate_seconds': candidate_seconds,
+        'speedup': reference_seconds / candidate_seconds if candidate_seconds > 0 else float('inf')
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import pandas as pd
+    from .bert_analyzer import BertBureaucrateseAnalyzer
+
+    parser = argparse.ArgumentParser(description='检查推理后端与eager模型的语义浓度一致性')
+    parser.add_argument('file_path', help='样本CSV文件路径')
+    parser.add_argument('--text-column', default='text', help='文本列的列名')
+    parser.add_argument('--sample', type=int, default=200, help='抽样的文本数')
+    parser.add_argument('--backend', choices=BACKENDS, default='onnx', help='待检查的推理后端')
+    parser.add_argument('--quantize', action='store_true', help='是否做动态int8量化')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_PARITY_TOLERANCE, help='允许的最大绝对误差')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.file_path)
+    sample = df[args.text_column].dropna()
+    sample = sample.sample(min(args.sample, len(sample)), random_state=0).tolist()
+
+    reference = BertBureaucrateseAnalyzer(device='cpu')
+    candidate = BertBureaucrateseAnalyzer(device='cpu', backend=args.backend, quantize=args.quantize)
+    report = check_parity(reference, candidate, sample, tolerance=args.tolerance)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    raise SystemExit(0 if report['passed'] else 1)
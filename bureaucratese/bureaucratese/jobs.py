@@ -0,0 +1,349 @@
+"""语料规模的异步分析任务
+
+Web服务只负责接收数据集文件、登记任务和返回结果，分析由独立的工作进程完成：
+
+    python -m bureaucratese.jobs --workers 2
+
+任务状态保存在与用户表相同的SQLite数据库中。工作进程原子地领取排队中的任务，
+按批分析并以检查点段的形式写入结果，每批结束后更新进度并检查是否被取消。
+工作进程中途退出时，任务在超过stale_after秒没有更新进度后可被其他工作进程
+重新领取，并从检查点继续。每次领取生成新的租约，记录在worker列中，
+进度更新和最终状态只在租约仍属于自己时生效；原工作进程只是变慢而任务已被
+重新领取时，它在下一次更新进度时发现租约已失效并立即停止，不再写入检查点。
+
+提交任务时按全部记录数扣减调用次数；任务被取消时退还尚未分析的记录数。
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from .quota import QuotaService, thread_connection, DEFAULT_DB_PATH
+from .parallel import set_worker_threads
+
+DEFAULT_JOBS_DIR = os.environ.get('BUREAUCRATESE_JOBS_DIR', 'jobs')
+DEFAULT_JOB_BATCH_SIZE = 1000
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_STALE_AFTER = 600.0
+
+JOB_FORMATS = ('parquet', 'csv', 'jsonl')
+JOB_METHODS = ('basic', 'weighted', 'semantic')
+# 各分析方法在结果中对应的列
+METHOD_COLUMNS = {
+    'basic': ['basic_density', 'official_words'],
+    'weighted': ['weighted_density'],
+    'semantic': ['semantic_density']
+}
+
+
+class JobStore:
+    """任务状态和任务文件的存储
+
+    Args:
+        db_path (str): SQLite数据库路径
+        jobs_dir (str): 保存上传文件和结果的目录，每个任务一个子目录
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, jobs_dir=DEFAULT_JOBS_DIR):
+        self.db_path = db_path
+        self.jobs_dir = Path(jobs_dir)
+        self._local = threading.local()
+        self.init_db()
+
+    def _connection(self):
+        return thread_connection(self._local, self.db_path)
+
+    def init_db(self):
+        """创建任务表"""
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                api_key TEXT,
+                status TEXT,
+                file_format TEXT,
+                text_column TEXT,
+                id_column TEXT,
+                methods TEXT,
+                total_rows INTEGER,
+                processed_rows INTEGER DEFAULT 0,
+                cancel_requested INTEGER DEFAULT 0,
+                worker TEXT,
+                error TEXT,
+                heartbeat REAL,
+                created_at TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_api_key ON jobs (api_key, created_at)')
+
+    def job_dir(self, job_id):
+        return self.jobs_dir / job_id
+
+    def input_path(self, job_id, file_format):
+        return self.job_dir(job_id) / f'input.{file_format}'
+
+    def output_dir(self, job_id):
+        return self.job_dir(job_id) / 'results'
+
+    def _fetch(self, query, params=()):
+        cursor = self._connection().execute(query, params)
+        names = [column[0] for column in cursor.description]
+        jobs = []
+        for row in cursor.fetchall():
+            job = dict(zip(names, row))
+            job['methods'] = json.loads(job['methods'])
+            jobs.append(job)
+        return jobs
+
+    def create(self, job_id, api_key, file_format, text_column, methods, total_rows, id_column=None):
+        """登记一个排队中的任务，输入文件应已保存在input_path(job_id, file_format)
+
+        Returns:
+            dict: 任务信息
+        """
+        self._connection().execute(
+            'INSERT INTO jobs (id, api_key, status, file_format, text_column, id_column, methods, '
+            'total_rows, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (job_id, api_key, 'queued', file_format, text_column, id_column,
+             json.dumps(list(methods)), total_rows, datetime.now())
+        )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """查询任务，不存在时返回None"""
+        jobs = self._fetch('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        return jobs[0] if jobs else None
+
+    def list_user_jobs(self, api_key):
+        """按提交时间倒序返回用户的所有任务"""
+        return self._fetch('SELECT * FROM jobs WHERE api_key = ? ORDER BY created_at DESC', (api_key,))
+
+    def count_by_status(self):
+        """返回各状态的任务数"""
+        return dict(self._connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def request_cancel(self, job_id):
+        """取消任务：排队中的任务立即取消，运行中的任务在当前批结束后停止
+
+        Returns:
+            bool: 任务是否已立即取消；为True时调用方应退还全部记录数，
+                运行中的任务由工作进程在停止后退还未分析的记录数
+        """
+        conn = self._connection()
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+            (datetime.now(), job_id)
+        )
+        if cursor.rowcount:
+            return True
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return False
+
+    def is_cancel_requested(self, job_id):
+        row = self._connection().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def claim(self, worker, stale_after=DEFAULT_STALE_AFTER):
+        """领取最早提交的排队任务，或长时间没有更新进度的运行中任务
+
+        Returns:
+            dict: 领取到的任务，没有可领取的任务时返回None；任务的worker为本次领取的租约，
+                之后调用heartbeat和finish时传入
+        """
+        conn = self._connection()
+        now = time.time()
+        lease = f'{worker}:{uuid.uuid4().hex[:12]}'
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat < ?) "
+                'ORDER BY created_at LIMIT 1',
+                (now - stale_after,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, "
+                    'started_at = COALESCE(started_at, ?) WHERE id = ?',
+                    (lease, now, datetime.now(), row[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return self.get(row[0]) if row is not None else None
+
+    def heartbeat(self, job_id, processed_rows, lease):
+        """更新任务进度
+
+        Returns:
+            bool: 租约是否仍然有效；为False时任务已被其他工作进程领取，应立即停止
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET processed_rows = ?, heartbeat = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (processed_rows, time.time(), job_id, lease)
+        )
+        return cursor.rowcount > 0
+
+    def finish(self, job_id, status, lease, error=None):
+        """记录任务的最终状态，租约已失效时不做修改
+
+        Returns:
+            bool: 是否已记录
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, error, datetime.now(), job_id, lease)
+        )
+        return cursor.rowcount > 0
+
+
+# 工作进程内复用的分析器
+_analyzer = None
+
+
+def _get_analyzer():
+    global _analyzer
+    if _analyzer is None:
+        from .analyzer import BureaucrateseAnalyzer
+        _analyzer = BureaucrateseAnalyzer()
+    return _analyzer
+
+
+def run_job(store, job, batch_size=DEFAULT_JOB_BATCH_SIZE, semantic_batch_size=32):
+    """执行一个任务，已写入检查点的记录不再重复分析
+
+    Args:
+        store (JobStore): 任务存储
+        job (dict): claim()返回的任务
+        batch_size (int): 每批读取和分析的记录数，也是进度更新和取消检查的粒度
+        semantic_batch_size (int): 语义分析每次前向计算的文本数
+
+    Returns:
+        str: 'completed'、'cancelled'，或租约已失效时为'lost'
+    """
+    from .checkpoint import CheckpointStore
+    from .corpus import list_columns, iter_record_batches, analyze_batch
+
+    job_id = job['id']
+    lease = job['worker']
+    input_path = store.input_path(job_id, job['file_format'])
+    text_column = job['text_column']
+    id_column = job['id_column']
+
+    columns = list_columns(input_path)
+    for column in [text_column] + ([id_column] if id_column else []):
+        if column not in columns:
+            raise ValueError(f"数据集中缺少'{column}'列")
+
+    analyzer = _get_analyzer()
+    bert_analyzer = None
+    if 'semantic' in job['methods']:
+        from .registry import get_bert_analyzer
+        bert_analyzer = get_bert_analyzer()
+    output_columns = [column for method in JOB_METHODS if method in job['methods'] for column in METHOD_COLUMNS[method]]
+
+    # 打开检查点会清理未提交的段，必须在确认持有租约之后
+    if not store.heartbeat(job_id, job['processed_rows'], lease):
+        return 'lost'
+    checkpoint = CheckpointStore(store.output_dir(job_id))
+    completed_ids = checkpoint.completed_ids()
+    read_columns = [text_column] + ([id_column] if id_column else [])
+    if not store.heartbeat(job_id, checkpoint.completed_count, lease):
+        return 'lost'
+
+    for _, batch in iter_record_batches(input_path, columns=read_columns, batch_size=batch_size):
+        if store.is_cancel_requested(job_id):
+            return 'cancelled'
+        if id_column:
+            batch = batch.set_index(id_column)
+        if completed_ids:
+            batch = batch[~batch.index.isin(completed_ids)]
+        if batch.empty:
+            continue
+
+        results = analyze_batch(batch[text_column], analyzer, bert_analyzer, semantic_batch_size=semantic_batch_size)
+        # 分析一批可能很慢，写入前确认租约仍然有效；更新成功同时刷新了心跳，
+        # 其他工作进程在写入完成前不会领取该任务
+        if not store.heartbeat(job_id, checkpoint.completed_count, lease):
+            return 'lost'
+        checkpoint.write_segment(results[output_columns])
+        if not store.heartbeat(job_id, checkpoint.completed_count, lease):
+            return 'lost'
+    return 'completed'
+
+
+def worker_loop(db_path=DEFAULT_DB_PATH, jobs_dir=DEFAULT_JOBS_DIR, batch_size=DEFAULT_JOB_BATCH_SIZE,
+                poll_interval=DEFAULT_POLL_INTERVAL, stale_after=DEFAULT_STALE_AFTER):
+    """不断领取并执行任务"""
+    store = JobStore(db_path, jobs_dir)
+    quota_service = QuotaService(db_path)
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    print(f"任务工作进程{worker}已启动")
+    while True:
+        job = store.claim(worker, stale_after)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        print(f"开始任务{job['id']}，共{job['total_rows']}条记录")
+        try:
+            status = run_job(store, job, batch_size=batch_size)
+            if status == 'lost':
+                print(f"任务{job['id']}已被其他工作进程领取，停止执行")
+                continue
+            # 只有记录下最终状态的工作进程退还次数，同一任务不会重复退还
+            if store.finish(job['id'], status, job['worker']) and status == 'cancelled':
+                job = store.get(job['id'])
+                quota_service.refund(job['api_key'], job['total_rows'] - job['processed_rows'])
+            print(f"任务{job['id']}已结束：{status}")
+        except Exception as e:
+            if store.finish(job['id'], 'failed', job['worker'], str(e)):
+                print(f"任务{job['id']}失败：{str(e)}")
+            else:
+                print(f"任务{job['id']}出错，但已被其他工作进程领取：{str(e)}")
+
+
+def _start_worker(kwargs, n_workers):
+    set_worker_threads(n_workers)
+    worker_loop(**kwargs)
+
+
+if __name__ == '__main__':
+    import argparse
+    import multiprocessing
+
+    parser = argparse.ArgumentParser(description='运行语料分析任务的工作进程')
+    parser.add_argument('--workers', type=int, default=1, help='工作进程数')
+    parser.add_argument('--db-path', default=DEFAULT_DB_PATH, help='SQLite数据库路径')
+    parser.add_argument('--jobs-dir', default=DEFAULT_JOBS_DIR, help='任务文件目录')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_JOB_BATCH_SIZE, help='每批分析的记录数')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help='没有任务时的轮询间隔（秒）')
+    parser.add_argument('--stale-after', type=float, default=DEFAULT_STALE_AFTER,
+                        help='运行中的任务超过该秒数未更新进度时可被重新领取')
+    args = parser.parse_args()
+
+    kwargs = {
+        'db_path': args.db_path,
+        'jobs_dir': args.jobs_dir,
+        'batch_size': args.batch_size,
+        'poll_interval': args.poll_interval,
+        'stale_after': args.stale_after
+    }
+    if args.workers <= 1:
+        worker_loop(**kwargs)
+    else:
+        processes = [
+            multiprocessing.Process(target=_start_worker, args=(kwargs, args.workers))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
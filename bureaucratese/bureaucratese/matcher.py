@@ -0,0 +1,228 @@
+"""不分词的官方话语快速匹配
+
+基础密度只需要统计官方话语出现的次数和总词数。快速模式用官方话语词表
+构建Aho-Corasick自动机，一次扫描找出所有匹配，再从中选出最左最长、
+互不重叠的匹配，耗时与文本长度和匹配数成正比，与词表大小无关；
+总词数则用字符类别粗略估计，不调用jieba分词。
+适合对海量文本做初筛，结果与基于分词的密度存在一定偏差，
+可用calibrate()在样本语料上评估偏差并拟合估计参数。
+"""
+import re
+import time
+import math
+from collections import deque
+
+# jieba对新闻文本分词时，每个未匹配的汉字词平均包含的字数
+DEFAULT_CHARS_PER_WORD = 1.6
+
+_HAN_RE = re.compile('[\u4e00-\u9fd5]')
+# jieba将连续的字母数字视为一个词
+_ALNUM_RE = re.compile(r'[a-zA-Z0-9+#&._%\-]+')
+# 其余非空白字符（主要是标点）jieba逐字切分
+_SYMBOL_RE = re.compile(r'[^\u4e00-\u9fd5a-zA-Z0-9+#&._%\-\s]')
+
+class _Automaton:
+    """Aho-Corasick自动机
+
+    goto[state]为该状态的转移表，fail[state]为失败转移，length[state]为以该状态
+    结尾的词长（不是词时为0），output[state]为沿失败转移可到达的最近的词结尾状态。
+    """
+    __slots__ = ('goto', 'fail', 'length', 'output')
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.length = [0]
+        for word in words:
+            if not isinstance(word, str) or not word:
+                continue
+            state = 0
+            for char in word:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.length.append(0)
+                state = next_state
+            self.length[state] = len(word)
+
+        # 按层次遍历计算失败转移和输出链接
+        self.fail = [0] * len(self.goto)
+        self.output = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[child] = fail
+                self.output[child] = fail if self.length[fail] else self.output[fail]
+                queue.append(child)
+
+    def longest_at(self, text):
+        """一次扫描找出所有匹配，返回{起始位置: 从该位置开始的最长匹配长度}"""
+        goto, fail, length, output = self.goto, self.fail, self.length, self.output
+        longest = {}
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if length[state] else output[state]
+            while match:
+                start = end - length[match]
+                if length[match] > longest.get(start, 0):
+                    longest[start] = length[match]
+                match = output[match]
+        return longest
+
+
+class OfficialWordMatcher:
+    """基于Aho-Corasick自动机的官方话语匹配器
+
+    Args:
+        words (iterable): 官方话语词语
+        chars_per_word (float): 估计总词数时每个未匹配汉字词的平均字数
+    """
+
+    def __init__(self, words, chars_per_word=DEFAULT_CHARS_PER_WORD):
+        self.chars_per_word = chars_per_word
+        automaton = _Automaton(words)
+        self._automaton = automaton if len(automaton.goto) > 1 else None
+
+    def find(self, text):
+        """返回文本中最左最长、互不重叠的官方话语匹配，保持原文顺序"""
+        if self._automaton is None:
+            return []
+        longest = self._automaton.longest_at(text)
+        matches = []
+        position = 0
+        for start in sorted(longest):
+            if start >= position:
+                position = start + longest[start]
+                matches.append(text[start:position])
+        return matches
+
+    def estimate_total_words(self, text, matches=None):
+        """按字符类别估计jieba分词后的总词数
+
+        Args:
+            text (str): 文本
+            matches (list, optional): find()的结果，未提供时重新匹配
+
+        Returns:
+            int: 估计的总词数
+        """
+        if matches is None:
+            matches = self.find(text)
+        counts = self.components(text, matches)
+        estimated = (
+            counts['matches']
+            + int(round(counts['unmatched_han'] / self.chars_per_word))
+            + counts['alnum_runs']
+            + counts['symbols']
+        )
+        return max(estimated, counts['matches'])
+
+    def components(self, text, matches=None):
+        """返回估计总词数所用的各项计数，供校准使用"""
+        if matches is None:
+            matches = self.find(text)
+        matched_han = len(_HAN_RE.findall(''.join(matches)))
+        return {
+            'matches': len(matches),
+            'unmatched_han': max(len(_HAN_RE.findall(text)) - matched_han, 0),
+            'alnum_runs': len(_ALNUM_RE.findall(text)),
+            'symbols': len(_SYMBOL_RE.findall(text))
+        }
+
+
+def _pearson(xs, ys):
+    n = len(xs)
+    if n < 2:
+        return float('nan')
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    var_y = sum((y - mean_y) ** 2 for y in ys)
+    if var_x == 0 or var_y == 0:
+        return float('nan')
+    return cov / math.sqrt(var_x * var_y)
+
+
+def calibrate(analyzer, texts):
+    """在样本语料上比较快速模式与基于jieba分词的基础密度
+
+    Args:
+        analyzer (BureaucrateseAnalyzer): 分析器
+        texts (iterable): 样本文本
+
+    Returns:
+        dict: 校准报告，包括样本数、密度误差、相关系数、两种模式的耗时，
+            以及拟合出的chars_per_word（可用于设置analyzer.fast_chars_per_word）
+    """
+    texts = [text for text in texts if isinstance(text, str) and text.strip()]
+    matcher = analyzer._get_matcher()
+
+    start = time.perf_counter()
+    jieba_results = [analyzer.analyze_text(text) for text in texts]
+    jieba_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fast_results = [analyzer.analyze_text_fast(text) for text in texts]
+    fast_seconds = time.perf_counter() - start
+
+    jieba_density = [result['density'] for result in jieba_results]
+    fast_density = [result['density'] for result in fast_results]
+    errors = [fast - exact for fast, exact in zip(fast_density, jieba_density)]
+
+    # 拟合每个未匹配汉字词的平均字数：未匹配汉字数之和 / 其余部分对应的jieba词数之和
+    unmatched_han = 0
+    residual_words = 0
+    for text, result in zip(texts, jieba_results):
+        counts = matcher.components(text)
+        unmatched_han += counts['unmatched_han']
+        residual_words += result['total_words'] - counts['matches'] - counts['alnum_runs'] - counts['symbols']
+    fitted_chars_per_word = unmatched_han / residual_words if residual_words > 0 else matcher.chars_per_word
+
+    n = len(texts)
+    return {
+        'samples': n,
+        'chars_per_word': matcher.chars_per_word,
+        'fitted_chars_per_word': fitted_chars_per_word,
+        'mean_absolute_error': sum(abs(e) for e in errors) / n if n else 0.0,
+        'max_absolute_error': max((abs(e) for e in errors), default=0.0),
+        'mean_bias': sum(errors) / n if n else 0.0,
+        'pearson_r': _pearson(fast_density, jieba_density),
+        'official_count_agreement': sum(
+            1 for fast, exact in zip(fast_results, jieba_results)
+            if fast['official_word_count'] == exact['official_word_count']
+        ) / n if n else 0.0,
+        'jieba_seconds': jieba_seconds,
+        'fast_seconds': fast_seconds,
+        'speedup': jieba_seconds / fast_seconds if fast_seconds > 0 else float('inf')
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import pandas as pd
+    from .analyzer import BureaucrateseAnalyzer
+
+    parser = argparse.ArgumentParser(description='在样本语料上校准快速模式')
+    parser.add_argument('file_path', help='样本CSV文件路径')
+    parser.add_argument('--text-column', default='text', help='文本列的列名')
+    parser.add_argument('--sample', type=int, default=1000, help='抽样的文本数')
+    parser.add_argument('--dict-path', default=None, help='自定义词典路径')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.file_path)
+    sample = df[args.text_column].dropna()
+    sample = sample.sample(min(args.sample, len(sample)), random_state=0)
+
+    report = calibrate(BureaucrateseAnalyzer(custom_dict_path=args.dict_path), sample.tolist())
+    print(json.dumps(report, ensure_ascii=False, indent=2))
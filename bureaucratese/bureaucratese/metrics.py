@@ -0,0 +1,400 @@
+"""运行指标
+
+在热点路径上记录各阶段耗时、批大小和请求延迟，并以Prometheus文本格式输出，
+供Web服务的/metrics接口使用。记录一次观测只需一次二分查找和一次加锁计数，
+开销在微秒级，可以在生产环境中常开；设置BUREAUCRATESE_METRICS=0可完全关闭。
+
+Gunicorn的每个工作进程各自计数。设置BUREAUCRATESE_METRICS_DIR后，各进程
+定期把自己的计数写入该目录，/metrics汇总所有进程：计数和直方图相加，
+当前值类指标（缓存大小、队列长度等）按pid分别输出，已退出进程的当前值不再输出。
+"""
+import os
+import json
+import time
+import bisect
+import threading
+from pathlib import Path
+from .fileutils import atomic_write
+
+ENABLED = os.environ.get('BUREAUCRATESE_METRICS', '1') != '0'
+MULTIPROCESS_DIR = os.environ.get('BUREAUCRATESE_METRICS_DIR')
+SNAPSHOT_INTERVAL = 5.0
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 阶段耗时的分桶上界（秒），覆盖从单次词典查找到长文档推理
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (
+        str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        for value in values
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Counter:
+    """只增不减的计数"""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+
+class Histogram:
+    """分桶计数的观测值分布
+
+    Args:
+        buckets (tuple): 升序的分桶上界，自动追加+Inf
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # 标签值 -> [各桶计数（非累积）, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), list(counts), total] for key, (counts, total) in self._values.items()]
+
+
+class CallbackMetric:
+    """在输出时调用callback读取的指标，用于已有自己计数的组件（缓存、队列等）
+
+    Args:
+        callback (callable): 无标签时返回一个数值；有标签时返回[(标签值字典, 数值)]；
+            返回None时不输出
+        type (str): 'gauge'表示当前值，'counter'表示callback返回的是累计计数
+    """
+
+    def __init__(self, name, help, callback, labelnames=(), type='gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.type = type
+
+    def snapshot(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"读取指标{self.name}失败：{str(e)}")
+            return []
+        if value is None:
+            return []
+        if not self.labelnames:
+            return [[[], float(value)]]
+        return [[[str(labels[name]) for name in self.labelnames], float(v)] for labels, v in value]
+
+
+class Registry:
+    """指标的注册表
+
+    Args:
+        multiprocess_dir (str, optional): 多进程汇总时各进程写入计数的目录
+    """
+
+    def __init__(self, multiprocess_dir=None):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = Path(multiprocess_dir) if multiprocess_dir else None
+        self._writer_pid = None
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标{metric.name}已注册")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=TIME_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, callback, labelnames=(), type='gauge'):
+        """注册在输出时读取的指标，同名指标已存在时替换"""
+        with self._lock:
+            self._metrics.pop(name, None)
+        return self._register(CallbackMetric(name, help, callback, labelnames, type))
+
+    def snapshot(self):
+        """返回本进程全部指标的可JSON序列化的快照"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {}
+        for metric in metrics:
+            entry = {
+                'type': metric.type,
+                'help': metric.help,
+                'labelnames': list(metric.labelnames),
+                'samples': metric.snapshot()
+            }
+            if metric.type == 'histogram':
+                entry['buckets'] = list(metric.buckets)
+            snapshot[metric.name] = entry
+        return snapshot
+
+    # 多进程汇总
+
+    def _snapshot_path(self, pid):
+        return self.multiprocess_dir / f'{pid}.json'
+
+    def write_snapshot(self):
+        """把本进程的快照原子地写入multiprocess_dir"""
+        if self.multiprocess_dir is None:
+            return
+        self.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        path = self._snapshot_path(pid)
+        with atomic_write(path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+
+    def ensure_writer(self):
+        """在当前进程中启动定期写入快照的后台线程，fork出的子进程各自启动一次"""
+        if self.multiprocess_dir is None or self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(SNAPSHOT_INTERVAL)
+                try:
+                    self.write_snapshot()
+                except OSError as e:
+                    print(f"写入指标快照失败：{str(e)}")
+
+        threading.Thread(target=run, name='metrics-writer', daemon=True).start()
+
+    def _collect(self):
+        """返回所有进程汇总后的快照"""
+        if self.multiprocess_dir is None:
+            return self.snapshot()
+        self.write_snapshot()
+
+        merged = {}
+        for path in sorted(self.multiprocess_dir.glob('*.json')):
+            pid = path.stem
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(int(pid)) if pid.isdigit() else False
+            for name, entry in snapshot.items():
+                if entry['type'] == 'gauge':
+                    # 当前值不能跨进程相加，按pid分别输出
+                    if not alive:
+                        continue
+                    target = merged.setdefault(name, dict(entry, labelnames=entry['labelnames'] + ['pid'], samples=[]))
+                    target['samples'].extend([labels + [pid], value] for labels, value in entry['samples'])
+                    continue
+
+                target = merged.setdefault(name, dict(entry, samples={}))
+                for sample in entry['samples']:
+                    key = tuple(sample[0])
+                    existing = target['samples'].get(key)
+                    if existing is None:
+                        target['samples'][key] = sample[1:]
+                    elif entry['type'] == 'histogram':
+                        existing[0] = [a + b for a, b in zip(existing[0], sample[1])]
+                        existing[1] += sample[2]
+                    else:
+                        existing[0] += sample[1]
+
+        for entry in merged.values():
+            if isinstance(entry['samples'], dict):
+                entry['samples'] = [[list(key)] + values for key, values in entry['samples'].items()]
+        return merged
+
+    def render(self):
+        """以Prometheus文本格式输出全部指标"""
+        lines = []
+        for name, entry in sorted(self._collect().items()):
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            labelnames = entry['labelnames']
+            if entry['type'] != 'histogram':
+                for labels, value in entry['samples']:
+                    lines.append(f'{name}{_format_labels(labelnames, labels)} {_format_value(value)}')
+                continue
+
+            bounds = list(entry['buckets']) + [float('inf')]
+            for labels, counts, total in entry['samples']:
+                cumulative = 0
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labelnames + ['le'], labels + [_format_value(float(bound))])
+                    lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labelnames, labels)} {_format_value(total)}')
+                lines.append(f'{name}_count{_format_labels(labelnames, labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def clear_multiprocess_dir(path=MULTIPROCESS_DIR):
+    """删除之前运行留下的进程快照，应在服务启动、fork工作进程之前调用"""
+    if not path:
+        return
+    for snapshot in Path(path).glob('*.json'):
+        snapshot.unlink()
+
+
+REGISTRY = Registry(MULTIPROCESS_DIR)
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'bureaucratese_stage_seconds', '各分析阶段的耗时（秒）', labelnames=('stage',)
+)
+BATCH_SIZE = REGISTRY.histogram(
+    'bureaucratese_batch_size', '批大小分布：micro_batch为合并的请求数，inference为每次前向计算的序列数',
+    labelnames=('kind',), buckets=BATCH_SIZE_BUCKETS
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'bureaucratese_request_seconds', 'HTTP请求从收到到响应发送完毕的耗时（秒）', labelnames=('path', 'status')
+)
+
+
+class _StageTimer:
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage):
+    """记录代码块耗时的上下文管理器
+
+    Args:
+        stage (str): 阶段名称，如'segmentation'、'forward_pass'
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _StageTimer(stage)
+
+
+def observe_batch_size(kind, size):
+    """记录一次批处理的条目数"""
+    if ENABLED:
+        BATCH_SIZE.observe(size, kind=kind)
+
+
+def process_memory():
+    """返回当前进程的常驻内存字节数，无法读取时返回None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux以KB为单位，macOS以字节为单位；此处只能得到峰值
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return None
+
+
+class MetricsMiddleware:
+    """记录每个HTTP请求耗时的ASGI中间件
+
+    以路由模板（如/jobs/{job_id}）而不是实际路径作为标签，标签取值有限。
+    流式响应的耗时包括发送完整个响应体的时间。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        REGISTRY.ensure_writer()
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            REQUEST_SECONDS.observe(time.perf_counter() - start, path=path, status=status[0])
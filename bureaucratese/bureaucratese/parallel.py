@@ -0,0 +1,88 @@
+"""多进程语料分析
+
+jieba分词是纯Python实现，受GIL限制只能使用一个CPU核心。
+这里用进程池把文本分块分发给多个工作进程，每个工作进程在初始化时
+创建一次分析器，之后只接收文本块，结果按输入顺序返回。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_CHUNK_SIZE = 256
+
+# 工作进程内的分析器，由_init_worker创建
+_worker_analyzer = None
+
+
+def resolve_n_jobs(n_jobs):
+    """将n_jobs转换为实际的进程数，-1表示使用全部CPU核心"""
+    cpu_count = os.cpu_count() or 1
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, cpu_count + 1 + n_jobs)
+    return n_jobs
+
+
+def set_worker_threads(n_workers):
+    """多个进程同时做BERT推理时平分CPU线程，未安装PyTorch时不做处理
+
+    Args:
+        n_workers (int): 同时运行的工作进程数
+
+    Returns:
+        int: 本进程的PyTorch计算线程数，未安装PyTorch时为None
+    """
+    try:
+        import torch
+    except ImportError:
+        return None
+    threads = max(1, (os.cpu_count() or 1) // n_workers)
+    torch.set_num_threads(threads)
+    return threads
+
+
+def _init_worker(custom_dict_path, use_bert, n_jobs):
+    global _worker_analyzer
+    if use_bert:
+        set_worker_threads(n_jobs)
+    from .analyzer import BureaucrateseAnalyzer
+    _worker_analyzer = BureaucrateseAnalyzer(custom_dict_path=custom_dict_path, use_bert=use_bert)
+
+
+def _analyze_chunk(texts, weighted):
+    return _worker_analyzer._analyze_texts(texts, weighted=weighted)
+
+
+def create_pool(n_jobs, custom_dict_path=None, use_bert=False):
+    """创建已初始化分析器的进程池
+
+    Args:
+        n_jobs (int): 进程数，-1表示使用全部CPU核心
+        custom_dict_path (str, optional): 自定义词典路径
+        use_bert (bool): 工作进程是否加载BERT模型
+
+    Returns:
+        ProcessPoolExecutor: 进程池
+    """
+    n_jobs = resolve_n_jobs(n_jobs)
+    return ProcessPoolExecutor(
+        max_workers=n_jobs,
+        initializer=_init_worker,
+        initargs=(custom_dict_path, use_bert, n_jobs)
+    )
+
+
+def submit_chunks(pool, texts, weighted=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """将文本分块提交到进程池，返回按输入顺序排列的future列表"""
+    return [
+        pool.submit(_analyze_chunk, texts[start:start + chunk_size], weighted)
+        for start in range(0, len(texts), chunk_size)
+    ]
+
+
+def collect_chunks(futures):
+    """按提交顺序收集各文本块的结果并拼接"""
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
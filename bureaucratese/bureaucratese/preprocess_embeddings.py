@@ -1,24 +1,271 @@
-import os
+import json
+import hashlib
 import torch
 import numpy as np
 import pandas as pd
+from datetime import datetime
 from pathlib import Path
 from transformers import BertModel, BertTokenizer
 from tqdm import tqdm
 from .download_bert import load_local_bert
+from .fileutils import atomic_write
 
-def preprocess_official_words(model_name='bert-base-chinese', custom_dict_path=None):
+# 缓存格式版本，格式变化时旧缓存自动失效
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / 'preprocessed'
+
+
+def model_fingerprint(model_name, model):
+    """计算模型的指纹
+
+    对每个参数张量的名称、形状以及首尾各256个数值取哈希，
+    权重发生变化时指纹随之改变，而不必读取整个模型文件。
+
+    Args:
+        model_name (str): BERT模型名称
+        model: 已加载的BERT模型
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256(model_name.encode('utf-8'))
+    for name, param in model.state_dict().items():
+        if not torch.is_tensor(param):
+            continue
+        flat = param.detach().reshape(-1).float().cpu()
+        digest.update(name.encode('utf-8'))
+        digest.update(str(tuple(param.shape)).encode('utf-8'))
+        digest.update(flat[:256].numpy().tobytes())
+        digest.update(flat[-256:].numpy().tobytes())
+    return digest.hexdigest()
+
+
+def dictionary_fingerprint(official_words, word_frequencies):
+    """计算官方话语词表及其词频的指纹
+
+    Args:
+        official_words (list): 官方话语词语列表
+        word_frequencies (dict): 词频字典
+
+    Returns:
+        str: 十六进制哈希值
+    """
+    digest = hashlib.sha256()
+    for word in official_words:
+        digest.update(f"{word}\t{word_frequencies.get(word, 1.0)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def embed_words(tokenizer, model, words, device, batch_size=256):
+    """批量计算词语的[CLS]向量
+
+    Args:
+        tokenizer: BERT分词器
+        model: BERT模型
+        words (list): 词语列表
+        device: 运行设备
+        batch_size (int): 每次前向计算的词数
+
+    Returns:
+        np.ndarray: 形状为(len(words), hidden_size)的float32矩阵
+    """
+    embeddings = np.empty((len(words), model.config.hidden_size), dtype=np.float32)
+    # 按长度排序，使同一批次的填充尽量少
+    order = sorted(range(len(words)), key=lambda i: len(words[i]))
+
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            inputs = tokenizer([words[i] for i in batch_indices], return_tensors='pt', padding=True)
+            inputs = {k: v.to(device) for k, v in inputs.items()}
+            outputs = model(**inputs)
+            # 使用[CLS]标记的输出作为词的表示
+            embeddings[batch_indices] = outputs.last_hidden_state[:, 0, :].cpu().numpy()
+
+    return embeddings
+
+
+class WordEmbeddingStore:
+    """按模型指纹划分的词向量存储
+
+    词向量以追加写入的分块文件保存，每块写完后原子地重命名。
+    计算中断后再次运行只会补算缺失的词，词典新增词语时也只计算新词。
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.index = {}
+        self._chunks = []
+        self._next_file_id = 0
+        self._load()
+
+    def _load(self):
+        if not self.store_dir.exists():
+            return
+        for chunk_file in sorted(self.store_dir.glob('chunk-*.npz')):
+            with np.load(chunk_file) as chunk:
+                words = chunk['words'].tolist()
+                embeddings = chunk['embeddings']
+            chunk_id = len(self._chunks)
+            self._chunks.append(embeddings)
+            for row, word in enumerate(words):
+                self.index[word] = (chunk_id, row)
+            self._next_file_id = max(self._next_file_id, int(chunk_file.stem.split('-')[1]) + 1)
+
+    def missing(self, words):
+        """返回尚未计算词向量的词语，保持输入顺序并去重"""
+        seen = set()
+        missing = []
+        for word in words:
+            if word not in self.index and word not in seen:
+                seen.add(word)
+                missing.append(word)
+        return missing
+
+    def add(self, words, embeddings):
+        """追加一块词向量，写入磁盘失败时只保存在内存中"""
+        chunk_id = len(self._chunks)
+        self._chunks.append(embeddings)
+        for row, word in enumerate(words):
+            self.index[word] = (chunk_id, row)
+
+        file_id = self._next_file_id
+        self._next_file_id += 1
+        try:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            chunk_file = self.store_dir / f'chunk-{file_id:06d}.npz'
+            with atomic_write(chunk_file) as tmp_file:
+                with open(tmp_file, 'wb') as f:
+                    np.savez(f, words=np.array(words), embeddings=embeddings)
+        except OSError as e:
+            print(f"警告：无法写入词向量缓存 {self.store_dir}: {str(e)}")
+
+    def lookup(self, words):
+        """按给定顺序取出词向量矩阵"""
+        if not words:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([self._chunks[chunk_id][row] for chunk_id, row in (self.index[w] for w in words)])
+
+
+def load_official_embeddings(tokenizer, model, model_name, official_words, word_frequencies, device,
+                             batch_size=256, chunk_size=4096, cache_dir=None, mmap=True, model_key=None):
+    """加载或计算官方话语词向量和权重
+
+    缓存以模型指纹和词典指纹共同作为键，模型或词典变化后不会误用旧缓存；
+    词典新增词语时只计算新增部分。默认以只读内存映射方式打开缓存文件，
+    同一台机器上的多个工作进程共享操作系统页缓存中的同一份数据。
+
+    Args:
+        tokenizer: BERT分词器
+        model: BERT模型
+        model_name (str): BERT模型名称
+        official_words (list): 官方话语词语列表
+        word_frequencies (dict): 词频字典
+        device: 运行设备
+        batch_size (int): 每次前向计算的词数
+        chunk_size (int): 每个缓存分块包含的词数
+        cache_dir (str, optional): 缓存目录，默认为包内的preprocessed目录
+        mmap (bool): 是否以只读内存映射方式加载缓存文件
+        model_key (str, optional): 已计算好的模型指纹，未提供时自动计算
+
+    Returns:
+        tuple: (L2归一化的float32词向量矩阵, 归一化的float32权重向量)
+    """
+    cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+    if model_key is None:
+        model_key = model_fingerprint(model_name, model)
+    dictionary_key = dictionary_fingerprint(official_words, word_frequencies)
+    cache_key = hashlib.sha256(
+        f"{CACHE_FORMAT_VERSION}:{model_key}:{dictionary_key}".encode('utf-8')
+    ).hexdigest()[:16]
+
+    artifact_dir = cache_dir / f'official-{cache_key}'
+    cached = _load_artifact(artifact_dir, model_key, dictionary_key, mmap=mmap)
+    if cached is not None:
+        print(f"从预处理文件加载词向量和权重（{artifact_dir.name}）...")
+        return cached
+
+    store = WordEmbeddingStore(cache_dir / f'words-{model_key[:16]}')
+    missing = store.missing(official_words)
+    if missing:
+        print(f"正在计算 {len(missing)} 个官方话语词向量...")
+        with tqdm(total=len(missing), desc="处理进度") as pbar:
+            for start in range(0, len(missing), chunk_size):
+                chunk_words = missing[start:start + chunk_size]
+                chunk_embeddings = embed_words(tokenizer, model, chunk_words, device, batch_size=batch_size)
+                store.add(chunk_words, chunk_embeddings)
+                pbar.update(len(chunk_words))
+
+    embeddings = store.lookup(official_words).astype(np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12))
+
+    weights = np.array([word_frequencies.get(word, 1.0) for word in official_words], dtype=np.float64)
+    weights = (weights / np.sum(weights)).astype(np.float32)
+
+    meta = {
+        'format': CACHE_FORMAT_VERSION,
+        'model_name': model_name,
+        'model_key': model_key,
+        'dictionary_key': dictionary_key,
+        'word_count': len(official_words),
+        'normalized': True,
+        'created_at': datetime.now().isoformat()
+    }
+    _save_artifact(artifact_dir, embeddings, weights, meta)
+
+    # 保存成功后改用内存映射的文件，释放刚计算出的内存副本
+    cached = _load_artifact(artifact_dir, model_key, dictionary_key, mmap=mmap)
+    if cached is not None:
+        return cached
+    return embeddings, weights
+
+
+def _load_artifact(artifact_dir, model_key, dictionary_key, mmap=True):
+    """读取与指纹匹配的预处理文件，不存在或不匹配时返回None"""
+    meta_file = artifact_dir / 'meta.json'
+    if not meta_file.exists():
+        return None
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('model_key') != model_key or meta.get('dictionary_key') != dictionary_key:
+        return None
+
+    mmap_mode = 'r' if mmap else None
+    embeddings = np.load(artifact_dir / 'official_embeddings.npy', mmap_mode=mmap_mode)
+    weights = np.load(artifact_dir / 'official_weights.npy', mmap_mode=mmap_mode)
+    return embeddings, weights
+
+
+def _save_artifact(artifact_dir, embeddings, weights, meta):
+    """先写入临时目录再整体重命名，避免其他进程读到写了一半的文件"""
+    try:
+        with atomic_write(artifact_dir) as tmp_dir:
+            tmp_dir.mkdir(parents=True, exist_ok=True)
+            np.save(tmp_dir / 'official_embeddings.npy', embeddings)
+            np.save(tmp_dir / 'official_weights.npy', weights)
+            with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        # 其他进程已写入相同的缓存时重命名会失败，此时直接使用已有文件即可
+        if not (artifact_dir / 'meta.json').exists():
+            print(f"警告：无法保存预处理文件到 {artifact_dir}: {str(e)}")
+
+def preprocess_official_words(model_name='bert-base-chinese', custom_dict_path=None, batch_size=256, cache_dir=None):
     """预处理官方话语词向量并保存到本地
-    
+
     Args:
         model_name (str): BERT模型名称
         custom_dict_path (str, optional): 自定义词典路径
+        batch_size (int): 每次前向计算的词数
+        cache_dir (str, optional): 缓存目录，默认为包内的preprocessed目录
     """
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    
+
     # 加载BERT模型
+    package_dir = Path(__file__).parent
     try:
-        package_dir = Path(__file__).parent
         model_dir = package_dir / 'models' / model_name
         tokenizer, model = load_local_bert(model_dir)
         model = model.to(device)
@@ -26,44 +273,23 @@ def preprocess_official_words(model_name='bert-base-chinese', custom_dict_path=N
         print(f"本地模型不存在，将从在线下载{model_name}模型...")
         tokenizer = BertTokenizer.from_pretrained(model_name)
         model = BertModel.from_pretrained(model_name).to(device)
-    
+
     model.eval()
-    
+
     # 加载词典
     if custom_dict_path is None:
-        package_dir = Path(__file__).parent
         custom_dict_path = package_dir / '../data/RAWdataset.csv'
-    
+
     df = pd.read_csv(custom_dict_path)
     official_words = df[df['typeOfWord'] == '官方话语']['Word'].tolist()
     word_frequencies = dict(zip(df['Word'], df['Frequency']))
-    
-    # 计算词向量
-    official_embeddings = []
-    official_weights = []
-    
-    print("正在计算官方话语词向量...")
-    with torch.no_grad():
-        for word in tqdm(official_words, desc="处理进度"):
-            inputs = tokenizer(word, return_tensors='pt', padding=True)
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            outputs = model(**inputs)
-            embedding = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-            official_embeddings.append(embedding[0])
-            official_weights.append(word_frequencies.get(word, 1.0))
-    
-    official_embeddings = np.array(official_embeddings)
-    official_weights = np.array(official_weights)
-    official_weights = official_weights / np.sum(official_weights)
-    
-    # 保存词向量和权重
-    save_dir = package_dir / 'preprocessed'
-    save_dir.mkdir(exist_ok=True)
-    
-    np.save(save_dir / 'official_embeddings.npy', official_embeddings)
-    np.save(save_dir / 'official_weights.npy', official_weights)
-    
-    print(f"预处理完成，词向量和权重已保存到 {save_dir}")
+
+    load_official_embeddings(
+        tokenizer, model, model_name, official_words, word_frequencies, device,
+        batch_size=batch_size, cache_dir=cache_dir
+    )
+
+    print(f"预处理完成，词向量和权重已保存到 {cache_dir or DEFAULT_CACHE_DIR}")
 
 if __name__ == '__main__':
-    preprocess_official_words()
\ No newline at end of file
+    preprocess_official_words()
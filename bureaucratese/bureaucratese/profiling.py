@@ -0,0 +1,423 @@
+"""分析阶段的性能剖析钩子
+
+BureaucrateseAnalyzer和BertBureaucrateseAnalyzer在分词、官方话语查找、BERT分词、
+前向计算和相似度计算等阶段前后调用profiler。没有挂上profiler时只记录
+metrics中的阶段耗时；用attach()挂上StageProfiler后，按sample_rate抽样的调用会依次经过各个钩子：
+
+    from bureaucratese.profiling import StageProfiler, TimerHook, CProfileHook, StackSamplingHook, attach
+
+    timer, sampler = TimerHook(), StackSamplingHook()
+    with attach(StageProfiler([timer, CProfileHook(), sampler], sample_rate=0.1), analyzer):
+        analyzer.analyze_file('news.csv')
+    sampler.write_collapsed('stacks.folded')  # 可直接用flamegraph.pl或speedscope打开
+
+attach()把profiler保存在contextvars中，只作用于调用它的线程或asyncio任务，
+在运行中的服务里使用时不会剖析其他并发请求。新建的线程不继承该上下文，
+starlette的run_in_threadpool会复制上下文；n_jobs大于1时工作进程中的分析不会被剖析。
+分析器的profiler属性对所有线程生效，只应在不与其他代码共享的分析器实例上设置。
+
+钩子实现start(stage)和stop(stage, state)：start的返回值原样传给stop，
+因此同一钩子可以被多个线程同时使用。
+"""
+import sys
+import time
+import random
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from .metrics import timed
+
+
+class TimerHook:
+    """按阶段累计调用次数和耗时
+
+    Args:
+        callback (callable, optional): 每次阶段结束时以(stage, seconds)调用，用于接入自定义计时器
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.max_seconds = defaultdict(float)
+
+    def start(self, stage):
+        return time.perf_counter()
+
+    def stop(self, stage, state):
+        seconds = time.perf_counter() - state
+        with self._lock:
+            self.calls[stage] += 1
+            self.seconds[stage] += seconds
+            self.max_seconds[stage] = max(self.max_seconds[stage], seconds)
+        if self.callback is not None:
+            self.callback(stage, seconds)
+
+    def summary(self):
+        """返回各阶段的调用次数、总耗时、平均和最长耗时（秒）"""
+        with self._lock:
+            return {
+                stage: {
+                    'calls': calls,
+                    'seconds': self.seconds[stage],
+                    'mean_seconds': self.seconds[stage] / calls,
+                    'max_seconds': self.max_seconds[stage]
+                }
+                for stage, calls in self.calls.items()
+            }
+
+    def collapsed(self):
+        """返回折叠栈格式的行，每个阶段一行，权重为微秒"""
+        with self._lock:
+            return [f'{stage} {int(seconds * 1e6)}' for stage, seconds in sorted(self.seconds.items())]
+
+
+class CProfileHook:
+    """对抽样的阶段调用运行cProfile，结果按阶段合并
+
+    cProfile同一时刻只能有一个实例处于启用状态，多个线程同时进入阶段时，
+    未能取得剖析权的调用直接跳过，计入skipped。
+    """
+
+    def __init__(self):
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self.stats = {}
+        self.skipped = 0
+
+    def start(self, stage):
+        import cProfile
+        if not self._active.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 已有其他剖析工具在运行
+            self._active.release()
+            with self._lock:
+                self.skipped += 1
+            return None
+        return profile
+
+    def stop(self, stage, state):
+        if state is None:
+            return
+        state.disable()
+        self._active.release()
+        import pstats
+        with self._lock:
+            if stage in self.stats:
+                self.stats[stage].add(state)
+            else:
+                self.stats[stage] = pstats.Stats(state)
+
+    def print_stats(self, stage=None, sort='cumulative', limit=20):
+        """打印一个或全部阶段耗时最多的函数"""
+        for name, stats in sorted(self.stats.items()):
+            if stage is None or name == stage:
+                print(f"===== {name} =====")
+                stats.sort_stats(sort).print_stats(limit)
+
+    def dump_stats(self, path, stage=None):
+        """把一个阶段或全部阶段合并后的结果保存为pstats文件，可用snakeviz等工具查看"""
+        import pstats
+        selected = [stats for name, stats in sorted(self.stats.items()) if stage is None or name == stage]
+        if not selected:
+            raise ValueError('没有可保存的剖析结果')
+        merged = pstats.Stats()
+        merged.add(*selected)
+        merged.dump_stats(path)
+
+
+class TracemallocHook:
+    """记录各阶段的内存分配
+
+    每次调用记录阶段内净增的内存和峰值；snapshots为True时还在阶段前后各取一次快照，
+    按代码行累计净增最多的分配位置。tracemalloc是进程级的，多线程同时执行时
+    其他线程的分配也会计入。
+
+    Args:
+        frames (int): tracemalloc记录的调用栈深度，未启动时以该深度启动
+        snapshots (bool): 是否按代码行统计分配位置，开销较大，应配合较低的抽样率
+    """
+
+    def __init__(self, frames=1, snapshots=False):
+        self.frames = frames
+        self.snapshots = snapshots
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.allocated = defaultdict(int)
+        self.peak = defaultdict(int)
+        self.top_lines = defaultdict(Counter)
+
+    def start(self, stage):
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot() if self.snapshots else None
+        return current, snapshot
+
+    def stop(self, stage, state):
+        import tracemalloc
+        before, snapshot = state
+        current, peak = tracemalloc.get_traced_memory()
+        differences = []
+        if snapshot is not None:
+            differences = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+        with self._lock:
+            self.calls[stage] += 1
+            self.allocated[stage] += current - before
+            self.peak[stage] = max(self.peak[stage], peak - before)
+            for difference in differences:
+                if difference.size_diff > 0:
+                    frame = difference.traceback[0]
+                    self.top_lines[stage][f'{frame.filename}:{frame.lineno}'] += difference.size_diff
+
+    def summary(self, limit=10):
+        """返回各阶段的调用次数、平均净增字节数、最大峰值字节数和分配最多的代码行"""
+        with self._lock:
+            return {
+                stage: {
+                    'calls': calls,
+                    'mean_allocated_bytes': self.allocated[stage] / calls,
+                    'max_peak_bytes': self.peak[stage],
+                    'top_lines': self.top_lines[stage].most_common(limit)
+                }
+                for stage, calls in self.calls.items()
+            }
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', code.co_filename)
+    return f'{module}:{code.co_name}'
+
+
+class StackSamplingHook:
+    """在阶段执行期间定时采样执行线程的调用栈，生成火焰图使用的折叠栈
+
+    后台线程只在有阶段执行时采样，每interval秒记录一次各执行线程的完整调用栈，
+    栈底为阶段名称。输出格式为每行"阶段;模块:函数;...;模块:函数 次数"，
+    可直接交给flamegraph.pl、speedscope或inferno。
+
+    Args:
+        interval (float): 采样间隔（秒）
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        # 线程id -> 当前阶段
+        self._active = {}
+        self._sampler = None
+        self.stacks = Counter()
+
+    def start(self, stage):
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = stage
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._sampler.start()
+        return thread_id
+
+    def stop(self, stage, state):
+        with self._lock:
+            self._active.pop(state, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                active = dict(self._active)
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, stage in active.items():
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                if names:
+                    samples.append(';'.join([stage] + names[::-1]))
+            del frames
+            with self._lock:
+                self.stacks.update(samples)
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        """返回折叠栈格式的行"""
+        with self._lock:
+            return [f'{stack} {count}' for stack, count in sorted(self.stacks.items())]
+
+    def write_collapsed(self, path):
+        """把折叠栈写入文件"""
+        write_collapsed(path, self.collapsed())
+
+
+def write_collapsed(path, lines):
+    """把折叠栈格式的行写入文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+class _ProfiledStage:
+    __slots__ = ('hooks', 'stage', 'timer', 'states')
+
+    def __init__(self, hooks, stage):
+        self.hooks = hooks
+        self.stage = stage
+        self.timer = timed(stage)
+
+    def __enter__(self):
+        self.timer.__enter__()
+        self.states = [hook.start(self.stage) for hook in self.hooks]
+        return self
+
+    def __exit__(self, *exc_info):
+        # 按进入的相反顺序退出，外层钩子的测量包含内层钩子的开销而不是相反
+        for hook, state in zip(reversed(self.hooks), reversed(self.states)):
+            hook.stop(self.stage, state)
+        self.timer.__exit__(*exc_info)
+        return False
+
+
+class StageProfiler:
+    """把剖析钩子挂到分析阶段上
+
+    Args:
+        hooks (list): 钩子，每个实现start(stage)和stop(stage, state)
+        sample_rate (float): 被剖析的阶段调用比例，1.0表示每次调用
+        stages (iterable, optional): 只剖析这些阶段，默认为全部
+        seed (int, optional): 抽样的随机种子
+    """
+
+    def __init__(self, hooks=(), sample_rate=1.0, stages=None, seed=None):
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('sample_rate必须在0到1之间')
+        self.hooks = list(hooks)
+        self.sample_rate = sample_rate
+        self.stages = set(stages) if stages is not None else None
+        self._random = random.Random(seed)
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def stage(self, name):
+        """返回包裹一次阶段调用的上下文管理器"""
+        if (
+            not self.hooks
+            or (self.stages is not None and name not in self.stages)
+            or (self.sample_rate < 1 and self._random.random() >= self.sample_rate)
+        ):
+            return timed(name)
+        return _ProfiledStage(list(self.hooks), name)
+
+
+# 当前上下文中由attach()挂上的剖析器：(profiler, 分析器id集合, 分析器列表)
+_attached = contextvars.ContextVar('bureaucratese_profiler', default=None)
+
+
+def stage(analyzer, name):
+    """分析器在各阶段调用的入口
+
+    依次使用分析器自身的profiler属性和当前上下文中attach()挂到该分析器上的profiler，
+    都没有时只记录阶段耗时。
+    """
+    profiler = analyzer.profiler
+    if profiler is None:
+        attached = _attached.get()
+        if attached is not None and id(analyzer) in attached[1]:
+            profiler = attached[0]
+    if profiler is None:
+        return timed(name)
+    return profiler.stage(name)
+
+
+@contextmanager
+def attach(profiler, *analyzers):
+    """在with块内对当前线程或asyncio任务中这些分析器的调用启用profiler
+
+    不修改分析器对象，其他线程和并发请求中的调用不受影响；嵌套使用时内层生效。
+    BureaucrateseAnalyzer启用了BERT时，其bert_analyzer也一并挂上。
+    """
+    targets = []
+    for analyzer in analyzers:
+        targets.append(analyzer)
+        bert_analyzer = getattr(analyzer, 'bert_analyzer', None)
+        if bert_analyzer is not None and bert_analyzer not in targets:
+            targets.append(bert_analyzer)
+    # 保留分析器的引用，with块内id不会被复用
+    token = _attached.set((profiler, frozenset(id(target) for target in targets), targets))
+    try:
+        yield profiler
+    finally:
+        _attached.reset(token)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import pandas as pd
+    from .analyzer import BureaucrateseAnalyzer
+
+    parser = argparse.ArgumentParser(description='剖析分析器在样本文本上各阶段的耗时和内存分配')
+    parser.add_argument('file_path', help='样本CSV文件路径')
+    parser.add_argument('--text-column', default='text', help='文本列的列名')
+    parser.add_argument('--method', choices=['basic', 'weighted', 'fast', 'semantic'], default='basic', help='分析方法')
+    parser.add_argument('--sample-rate', type=float, default=1.0, help='被剖析的阶段调用比例')
+    parser.add_argument('--stages', default=None, help='只剖析这些阶段，逗号分隔')
+    parser.add_argument('--cprofile', default=None, help='保存cProfile结果的路径')
+    parser.add_argument('--collapsed', default=None, help='保存折叠栈（火焰图输入）的路径')
+    parser.add_argument('--tracemalloc', action='store_true', help='是否记录内存分配')
+    args = parser.parse_args()
+
+    texts = pd.read_csv(args.file_path)[args.text_column].dropna().tolist()
+    timer = TimerHook()
+    hooks = [timer]
+    cprofile_hook = CProfileHook() if args.cprofile else None
+    sampler = StackSamplingHook() if args.collapsed else None
+    tracemalloc_hook = TracemallocHook(snapshots=True) if args.tracemalloc else None
+    hooks += [hook for hook in (tracemalloc_hook, cprofile_hook, sampler) if hook is not None]
+    profiler = StageProfiler(
+        hooks,
+        sample_rate=args.sample_rate,
+        stages=[name.strip() for name in args.stages.split(',')] if args.stages else None
+    )
+
+    analyzer = BureaucrateseAnalyzer(use_bert=args.method == 'semantic')
+    with attach(profiler, analyzer):
+        if args.method == 'semantic':
+            analyzer.bert_analyzer.calculate_semantic_density_batch(texts)
+        else:
+            analyze = {
+                'basic': analyzer.analyze_text,
+                'weighted': analyzer.analyze_text_weighted,
+                'fast': analyzer.analyze_text_fast
+            }[args.method]
+            for text in texts:
+                analyze(text)
+
+    report = {'stages': timer.summary()}
+    if tracemalloc_hook is not None:
+        report['memory'] = tracemalloc_hook.summary()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if cprofile_hook is not None:
+        cprofile_hook.dump_stats(args.cprofile)
+        print(f"cProfile结果已保存到 {args.cprofile}")
+    if sampler is not None:
+        sampler.write_collapsed(args.collapsed)
+        print(f"折叠栈已保存到 {args.collapsed}")
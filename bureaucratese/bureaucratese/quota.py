@@ -0,0 +1,339 @@
+"""API用户与调用次数的存储
+
+每个线程持有一个长期打开的WAL模式SQLite连接，不再为每个请求新建连接。
+扣减调用次数用一条带条件的UPDATE完成检查和累加，多个工作进程并发请求时
+不会超出配额。
+
+通过验证的API密钥在每个工作进程内缓存user_cache_ttl秒，认证不再需要查询数据库；
+配额仍由consume()在数据库中原子检查，缓存只用于认证和提前拒绝。
+
+可选的写回模式在内存中累计调用次数，由后台线程定期写入数据库，请求路径上
+不再有写操作；代价是多个工作进程之间的配额检查不再严格，最多可能超出
+各进程尚未写回的次数。
+"""
+import os
+import uuid
+import sqlite3
+import time
+import threading
+from datetime import datetime
+
+DEFAULT_DB_PATH = 'bureaucratese.db'
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_USER_CACHE_TTL = 5.0
+
+# UPDATE ... RETURNING 需要SQLite 3.35及以上版本
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def thread_connection(local, db_path):
+    """返回当前线程的WAL模式数据库连接，fork后的子进程重新连接
+
+    Args:
+        local (threading.local): 保存连接的线程局部对象
+        db_path (str): SQLite数据库路径
+
+    Returns:
+        sqlite3.Connection: 自动提交模式的连接，需要事务时显式执行BEGIN
+    """
+    conn = getattr(local, 'conn', None)
+    if conn is None or local.pid != os.getpid():
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        local.conn = conn
+        local.pid = os.getpid()
+    return conn
+
+
+class QuotaService:
+    """用户配额服务
+
+    Args:
+        db_path (str): SQLite数据库路径
+        write_behind (bool): 是否在内存中累计调用次数并定期写回
+        flush_interval (float): 写回模式下两次写回之间的秒数
+        user_cache_ttl (float): 用户信息缓存的秒数，为0时每次都查询数据库
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, write_behind=False, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 user_cache_ttl=DEFAULT_USER_CACHE_TTL):
+        self.db_path = db_path
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.user_cache_ttl = user_cache_ttl
+        self._local = threading.local()
+
+        # api_key -> (过期时间, 用户信息)；只缓存有效的密钥，新建的用户不会被旧的缓存拒绝
+        self._users = {}
+        self._users_lock = threading.Lock()
+
+        # 写回模式的内存状态：api_key -> [quota, 已写入数据库的次数, 尚未写回的次数]
+        self._counters = {}
+        self._counter_lock = threading.Lock()
+        self._flush_thread = None
+        self._stop = threading.Event()
+
+        self.init_db()
+
+    def _connection(self):
+        return thread_connection(self._local, self.db_path)
+
+    def init_db(self):
+        """创建用户表"""
+        self._connection().execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                api_key TEXT UNIQUE,
+                quota INTEGER,
+                used_count INTEGER DEFAULT 0,
+                created_at TIMESTAMP
+            )
+        ''')
+
+    def create_user(self, quota):
+        """创建用户并生成API密钥
+
+        Returns:
+            dict: 用户ID、API密钥和配额
+        """
+        user_id = str(uuid.uuid4())
+        api_key = str(uuid.uuid4())
+        self._connection().execute(
+            'INSERT INTO users (id, api_key, quota, created_at) VALUES (?, ?, ?, ?)',
+            (user_id, api_key, quota, datetime.now())
+        )
+        self.invalidate(api_key)
+        return {'user_id': user_id, 'api_key': api_key, 'quota': quota}
+
+    def set_quota(self, api_key, quota):
+        """修改用户的配额
+
+        Returns:
+            bool: 用户是否存在
+        """
+        cursor = self._connection().execute('UPDATE users SET quota = ? WHERE api_key = ?', (quota, api_key))
+        self.invalidate(api_key)
+        if self.write_behind:
+            with self._counter_lock:
+                counter = self._counters.get(api_key)
+                if counter is not None:
+                    counter[0] = quota
+        return cursor.rowcount > 0
+
+    def invalidate(self, api_key=None):
+        """使一个或全部用户的缓存失效"""
+        with self._users_lock:
+            if api_key is None:
+                self._users.clear()
+            else:
+                self._users.pop(api_key, None)
+
+    def get_user(self, api_key, use_cache=True):
+        """查询用户，密钥无效时返回None
+
+        Args:
+            api_key (str): API密钥
+            use_cache (bool): 是否使用缓存；缓存中的used_count可能略有滞后
+
+        Returns:
+            dict: 包括id、api_key、quota、used_count
+        """
+        user = None
+        if use_cache and self.user_cache_ttl > 0:
+            with self._users_lock:
+                cached = self._users.get(api_key)
+            if cached is not None and cached[0] > time.monotonic():
+                user = dict(cached[1])
+
+        if user is None:
+            row = self._connection().execute(
+                'SELECT id, api_key, quota, used_count FROM users WHERE api_key = ?', (api_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            user = {'id': row[0], 'api_key': row[1], 'quota': row[2], 'used_count': row[3]}
+            self._remember_user(user)
+
+        if self.write_behind:
+            with self._counter_lock:
+                counter = self._counters.get(api_key)
+                if counter is not None:
+                    user['used_count'] = counter[1] + counter[2]
+        return user
+
+    def _remember_user(self, user):
+        if self.user_cache_ttl > 0:
+            with self._users_lock:
+                self._users[user['api_key']] = (time.monotonic() + self.user_cache_ttl, user)
+
+    def _update_cached_usage(self, api_key, quota, used_count):
+        # 用扣减语句返回的最新值更新缓存，/quota查询到的次数不会滞后于本进程的扣减
+        with self._users_lock:
+            cached = self._users.get(api_key)
+            if cached is not None:
+                user = dict(cached[1])
+                user['quota'] = quota
+                user['used_count'] = used_count
+                self._users[api_key] = (cached[0], user)
+
+    def consume(self, api_key, n=1):
+        """检查并扣减调用次数
+
+        Args:
+            api_key (str): API密钥
+            n (int): 本次消耗的次数
+
+        Returns:
+            int: 扣减后的剩余次数；密钥无效或剩余次数不足时返回None，此时不扣减
+        """
+        if self.write_behind:
+            return self._consume_in_memory(api_key, n)
+
+        conn = self._connection()
+        if _HAS_RETURNING:
+            row = conn.execute(
+                'UPDATE users SET used_count = used_count + ? '
+                'WHERE api_key = ? AND used_count + ? <= quota '
+                'RETURNING quota, used_count',
+                (n, api_key, n)
+            ).fetchone()
+        else:
+            row = self._consume_in_transaction(conn, api_key, n)
+        if row is None:
+            # 配额可能已被修改，下次认证时重新查询
+            self.invalidate(api_key)
+            return None
+        self._update_cached_usage(api_key, row[0], row[1])
+        return row[0] - row[1]
+
+    def refund(self, api_key, n):
+        """退还已扣减但未使用的调用次数，已用次数不会低于0
+
+        Args:
+            api_key (str): API密钥
+            n (int): 退还的次数
+        """
+        if n <= 0:
+            return
+        if self.write_behind:
+            # 先抵消本进程尚未写回的次数，其余的从数据库中退还；
+            # 下次写回时会从数据库同步，这里先让本进程的配额检查立即生效
+            with self._counter_lock:
+                counter = self._counters.get(api_key)
+                if counter is not None:
+                    unflushed = min(counter[2], n)
+                    counter[2] -= unflushed
+                    n -= unflushed
+                    counter[1] = max(counter[1] - n, 0)
+            if n <= 0:
+                return
+        self._connection().execute(
+            'UPDATE users SET used_count = MAX(used_count - ?, 0) WHERE api_key = ?', (n, api_key)
+        )
+        self.invalidate(api_key)
+
+    def _consume_in_transaction(self, conn, api_key, n):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                'UPDATE users SET used_count = used_count + ? '
+                'WHERE api_key = ? AND used_count + ? <= quota',
+                (n, api_key, n)
+            )
+            row = None
+            if cursor.rowcount:
+                row = conn.execute('SELECT quota, used_count FROM users WHERE api_key = ?', (api_key,)).fetchone()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return row
+
+    def _consume_in_memory(self, api_key, n):
+        self._ensure_flush_thread()
+        with self._counter_lock:
+            counter = self._counters.get(api_key)
+        if counter is None:
+            # 第一次使用该密钥时在锁外查询数据库，查询期间其他密钥的扣减不受阻塞
+            row = self._connection().execute(
+                'SELECT quota, used_count FROM users WHERE api_key = ?', (api_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            loaded = [row[0], row[1], 0]
+        with self._counter_lock:
+            if counter is None:
+                # 其他线程可能已经先加载了同一密钥，保留先加载的计数
+                counter = self._counters.setdefault(api_key, loaded)
+            quota, used_count, pending = counter
+            if used_count + pending + n > quota:
+                return None
+            counter[2] += n
+            return quota - used_count - counter[2]
+
+    def _ensure_flush_thread(self):
+        # 写回线程在第一次请求时才启动，gunicorn预加载时不会在主进程中创建线程
+        if self._flush_thread is None or not self._flush_thread.is_alive():
+            self._stop.clear()
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"写回调用次数时出错：{str(e)}")
+
+    def flush(self):
+        """把内存中累计的调用次数写入数据库，并刷新各用户的配额和已用次数"""
+        with self._counter_lock:
+            api_keys = list(self._counters)
+            pending = {api_key: counter[2] for api_key, counter in self._counters.items() if counter[2]}
+            # 待写回的次数先计入已写入的次数，写回期间的配额检查仍然包含它们
+            for api_key, n in pending.items():
+                self._counters[api_key][1] += n
+                self._counters[api_key][2] = 0
+        if not api_keys:
+            return
+
+        conn = self._connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'UPDATE users SET used_count = used_count + ? WHERE api_key = ?',
+                [(n, api_key) for api_key, n in pending.items()]
+            )
+            rows = conn.execute(
+                f'SELECT api_key, quota, used_count FROM users WHERE api_key IN ({",".join("?" * len(api_keys))})',
+                api_keys
+            ).fetchall()
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            # 写入失败时把次数加回去，下次重试
+            with self._counter_lock:
+                for api_key, n in pending.items():
+                    self._counters[api_key][1] -= n
+                    self._counters[api_key][2] += n
+            raise
+
+        # 同步其他工作进程写入的次数和管理员修改后的配额
+        with self._counter_lock:
+            for api_key, quota, used_count in rows:
+                counter = self._counters.get(api_key)
+                if counter is not None:
+                    counter[0] = quota
+                    counter[1] = used_count
+
+    def close(self):
+        """停止写回线程并写回剩余的调用次数"""
+        if self._flush_thread is not None:
+            self._stop.set()
+            self._flush_thread.join()
+            self._flush_thread = None
+        if self.write_behind:
+            self.flush()
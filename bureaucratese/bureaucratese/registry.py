@@ -0,0 +1,95 @@
+"""进程级BERT分析器注册表
+
+BERT分析器的构建包括模型加载、词典解析和词向量加载，耗时数秒。
+注册表按(模型名称, 词典路径, 设备, 推理后端, 是否量化)缓存分析器实例，同一进程内的
+所有调用方共享同一个实例，只在第一次使用时创建。
+"""
+import os
+import threading
+from pathlib import Path
+
+_analyzers = {}
+_lock = threading.Lock()
+
+DEFAULT_WARM_UP_TEXT = '深入贯彻新发展理念，全面推进乡村振兴战略'
+
+
+def _resolve_dict_path(custom_dict_path=None):
+    if custom_dict_path is None:
+        package_dir = Path(__file__).parent
+        custom_dict_path = package_dir / '../data/RAWdataset.csv'
+    return str(Path(custom_dict_path).resolve())
+
+
+def _resolve_device(device=None):
+    if device is None:
+        import torch
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    return str(device)
+
+
+def get_bert_analyzer(model_name='bert-base-chinese', custom_dict_path=None, device=None,
+                      backend=None, quantize=None):
+    """获取共享的BERT分析器，不存在时创建
+
+    Args:
+        model_name (str): BERT模型名称
+        custom_dict_path (str, optional): 自定义词典路径
+        device (str, optional): 运行设备，默认自动选择cuda或cpu
+        backend (str, optional): 推理后端，默认读取BUREAUCRATESE_BACKEND环境变量，未设置时为'eager'
+        quantize (bool, optional): 是否做动态int8量化，默认读取BUREAUCRATESE_QUANTIZE环境变量
+
+    Returns:
+        BertBureaucrateseAnalyzer: 共享的分析器实例
+    """
+    if backend is None:
+        backend = os.environ.get('BUREAUCRATESE_BACKEND', 'eager')
+    if quantize is None:
+        quantize = os.environ.get('BUREAUCRATESE_QUANTIZE') == '1'
+    key = (model_name, _resolve_dict_path(custom_dict_path), _resolve_device(device), backend, bool(quantize))
+    analyzer = _analyzers.get(key)
+    if analyzer is not None:
+        return analyzer
+
+    with _lock:
+        analyzer = _analyzers.get(key)
+        if analyzer is None:
+            from .bert_analyzer import BertBureaucrateseAnalyzer
+            analyzer = BertBureaucrateseAnalyzer(
+                model_name=model_name,
+                custom_dict_path=custom_dict_path,
+                device=key[2],
+                backend=backend,
+                quantize=key[4]
+            )
+            _analyzers[key] = analyzer
+    return analyzer
+
+
+def warm_up(model_name='bert-base-chinese', custom_dict_path=None, device=None, text=DEFAULT_WARM_UP_TEXT,
+            backend=None, quantize=None):
+    """预先创建分析器并完成一次前向计算
+
+    适合在服务启动时调用，使第一个请求不必承担模型加载的开销。
+
+    Args:
+        model_name (str): BERT模型名称
+        custom_dict_path (str, optional): 自定义词典路径
+        device (str, optional): 运行设备
+        text (str): 用于预热的示例文本
+        backend (str, optional): 推理后端
+        quantize (bool, optional): 是否做动态int8量化
+
+    Returns:
+        BertBureaucrateseAnalyzer: 预热后的分析器实例
+    """
+    analyzer = get_bert_analyzer(model_name=model_name, custom_dict_path=custom_dict_path, device=device,
+                                 backend=backend, quantize=quantize)
+    analyzer.calculate_semantic_density(text)
+    return analyzer
+
+
+def clear():
+    """清空注册表，释放对已创建分析器的引用"""
+    with _lock:
+        _analyzers.clear()
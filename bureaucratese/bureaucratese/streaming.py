@@ -0,0 +1,169 @@
+"""NDJSON格式的流式批量分析
+
+请求体每行一条记录，可以是JSON字符串，也可以是包含text字段（以及可选id字段）
+的JSON对象。记录按固定大小的块读取和分析，每块完成后立即输出该块的结果，
+每行一个JSON对象，内存占用只取决于块大小。Web服务用astream_analysis
+边接收请求体边分析，第一块结果在上传完成前即可返回。
+"""
+import json
+import asyncio
+
+DEFAULT_STREAM_CHUNK_SIZE = 256
+MAX_STREAM_CHUNK_SIZE = 1024
+
+
+def parse_record(line):
+    """解析一行NDJSON记录
+
+    Returns:
+        tuple: (记录ID, 文本)，未提供ID时为None
+
+    Raises:
+        ValueError: 该行不是合法的记录
+    """
+    record = json.loads(line)
+    if isinstance(record, str):
+        return None, record
+    if isinstance(record, dict) and isinstance(record.get('text'), str):
+        return record.get('id'), record['text']
+    raise ValueError('每行必须是字符串或包含text字段的对象')
+
+
+def _parse_line(line_number, line):
+    """解析一行，返回(行号, 记录ID, 文本, 错误信息)，空行返回None"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record_id, text = parse_record(line)
+        return line_number, record_id, text, None
+    except ValueError as e:
+        return line_number, None, None, str(e)
+
+
+def iter_ndjson_chunks(f, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+    """按块读取二进制文件对象中的NDJSON记录，跳过空行
+
+    Yields:
+        list: (行号, 记录ID, 文本, 错误信息)，解析失败时文本为None
+    """
+    chunk = []
+    for line_number, line in enumerate(f, 1):
+        item = _parse_line(line_number, line)
+        if item is None:
+            continue
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def aiter_ndjson_chunks(byte_stream, chunk_size=DEFAULT_STREAM_CHUNK_SIZE):
+    """按块读取异步字节流（如request.stream()）中的NDJSON记录，边接收边切分
+
+    Yields:
+        list: 同iter_ndjson_chunks
+    """
+    chunk = []
+    buffer = bytearray()
+    line_number = 0
+    async for data in byte_stream:
+        buffer.extend(data)
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            continue
+        lines = bytes(buffer[:end]).split(b'\n')
+        del buffer[:end + 1]
+        for line in lines:
+            line_number += 1
+            item = _parse_line(line_number, line)
+            if item is None:
+                continue
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    item = _parse_line(line_number + 1, bytes(buffer))
+    if item is not None:
+        chunk.append(item)
+    if chunk:
+        yield chunk
+
+
+def _dumps(obj):
+    return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def _analyze_chunk(chunk, analyzer, method, consume):
+    """扣减次数并分析一块记录
+
+    Returns:
+        tuple: (输出行列表, 是否因次数不足而停止)
+    """
+    valid = [item for item in chunk if item[3] is None]
+    if valid and consume is not None and consume(len(valid)) is None:
+        return [_dumps({'line': chunk[0][0], 'error': 'API调用次数已达上限'})], True
+
+    results = {}
+    if valid:
+        try:
+            analyzed = analyzer.analyze_texts([item[2] for item in valid], method)
+            results = {item[0]: result for item, result in zip(valid, analyzed)}
+        except Exception as e:
+            results = {item[0]: e for item in valid}
+
+    lines = []
+    for line_number, record_id, _, error in chunk:
+        output = {'line': line_number, 'id': record_id}
+        result = results.get(line_number)
+        if error is not None:
+            output['error'] = error
+        elif isinstance(result, Exception):
+            output['error'] = str(result)
+        else:
+            output['result'] = result
+        lines.append(_dumps(output))
+    return lines, False
+
+
+def stream_analysis(f, analyzer, method='basic', chunk_size=DEFAULT_STREAM_CHUNK_SIZE, consume=None):
+    """逐块分析NDJSON记录并逐行输出结果
+
+    Args:
+        f: 以二进制方式读取的NDJSON文件对象，生成器结束时关闭
+        analyzer (BureaucrateseAPI): 分析API，语义分析对每块做一次批量推理
+        method (str): 分析方法
+        chunk_size (int): 每块的记录数
+        consume (callable, optional): 每块分析前调用consume(n)扣减调用次数，
+            返回None表示次数不足，此时输出错误并停止
+
+    Yields:
+        bytes: 一行NDJSON结果，包括line、id以及result或error字段
+    """
+    chunk_size = min(max(chunk_size, 1), MAX_STREAM_CHUNK_SIZE)
+    try:
+        for chunk in iter_ndjson_chunks(f, chunk_size):
+            lines, stop = _analyze_chunk(chunk, analyzer, method, consume)
+            yield from lines
+            if stop:
+                return
+    finally:
+        f.close()
+
+
+async def astream_analysis(byte_stream, analyzer, method='basic', chunk_size=DEFAULT_STREAM_CHUNK_SIZE, consume=None):
+    """stream_analysis的异步版本，边接收请求体边分析
+
+    每块记录凑齐后立即在线程池中分析并输出结果，不等待请求体全部到达，
+    扣减次数和分析都不阻塞事件循环。参数同stream_analysis，byte_stream为异步字节流。
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = min(max(chunk_size, 1), MAX_STREAM_CHUNK_SIZE)
+    async for chunk in aiter_ndjson_chunks(byte_stream, chunk_size):
+        lines, stop = await loop.run_in_executor(None, _analyze_chunk, chunk, analyzer, method, consume)
+        for line in lines:
+            yield line
+        if stop:
+            return
@@ -1,11 +1,22 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.security import APIKeyHeader
+from starlette.concurrency import run_in_threadpool
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
+import os
 import jwt
-import sqlite3
 import uuid
+import shutil
 from .api import BureaucrateseAPI
+from .registry import warm_up
+from .batching import MicroBatcher
+from .quota import QuotaService
+from .streaming import astream_analysis, DEFAULT_STREAM_CHUNK_SIZE
+from .jobs import JobStore, JOB_FORMATS, JOB_METHODS
+from .corpus import list_columns, count_rows
+from .checkpoint import committed_segments
+from . import metrics
 
 app = FastAPI(
     title="Bureaucratese API",
@@ -13,46 +24,70 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# 数据库初始化
-def init_db():
-    conn = sqlite3.connect('bureaucratese.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            api_key TEXT UNIQUE,
-            quota INTEGER,
-            used_count INTEGER DEFAULT 0,
-            created_at TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-# 初始化数据库
-init_db()
+# 记录每个请求的耗时，汇总在/metrics中
+app.add_middleware(metrics.MetricsMiddleware)
+
+# 用户与调用次数存储，设置BUREAUCRATESE_QUOTA_WRITE_BEHIND=1后调用次数在内存中累计并定期写回
+quota_service = QuotaService(
+    'bureaucratese.db',
+    write_behind=os.environ.get('BUREAUCRATESE_QUOTA_WRITE_BEHIND') == '1'
+)
 
 # API密钥认证
 api_key_header = APIKeyHeader(name="X-API-Key")
 
-# 用户认证中间件
-def get_current_user(api_key: str = Depends(api_key_header)):
-    conn = sqlite3.connect('bureaucratese.db')
-    c = conn.cursor()
-    c.execute('SELECT * FROM users WHERE api_key = ?', (api_key,))
-    user = c.fetchone()
-    conn.close()
+def authenticate(api_key: str = Depends(api_key_header)):
+    """只验证API密钥，不检查剩余次数"""
+    with metrics.timed('auth'):
+        user = quota_service.get_user(api_key)
     
     if not user:
         raise HTTPException(status_code=401, detail="无效的API密钥")
     
-    if user[2] <= user[3]:  # quota <= used_count
-        raise HTTPException(status_code=403, detail="API调用次数已达上限")
+    return user
+
+# 用户认证中间件
+def get_current_user(user: dict = Depends(authenticate)):
+    api_key = user["api_key"]
+    if user["quota"] <= user["used_count"]:
+        # 缓存的用户信息可能滞后于配额修改，拒绝前重新查询数据库
+        user = quota_service.get_user(api_key, use_cache=False)
+        if user["quota"] <= user["used_count"]:
+            raise HTTPException(status_code=403, detail="API调用次数已达上限")
     
-    return {"id": user[0], "api_key": user[1], "quota": user[2], "used_count": user[3]}
+    return user
 
-# 初始化分析器
-analyzer = BureaucrateseAPI(use_bert=True)
+def consume_quota(api_key: str, n: int = 1) -> int:
+    """原子地检查并扣减调用次数，返回剩余次数"""
+    with metrics.timed('quota'):
+        remaining = quota_service.consume(api_key, n)
+    if remaining is None:
+        raise HTTPException(status_code=403, detail="API调用次数已达上限")
+    return remaining
+
+# 初始化分析器，设置BUREAUCRATESE_CACHE_PATH后结果缓存在服务重启后仍然有效
+analyzer = BureaucrateseAPI(use_bert=True, cache_path=os.environ.get('BUREAUCRATESE_CACHE_PATH'))
+
+# 并发的语义分析请求合并为一批推理，批大小和等待时间由
+# BUREAUCRATESE_MAX_BATCH_SIZE和BUREAUCRATESE_MAX_WAIT_MS环境变量配置
+semantic_batcher = MicroBatcher(lambda texts: analyzer.analyze_texts(texts, 'semantic'))
+
+# 设置BUREAUCRATESE_SENTENCE_CACHE_PATH后句子向量缓存在启动时加载、关闭时保存
+SENTENCE_CACHE_PATH = os.environ.get('BUREAUCRATESE_SENTENCE_CACHE_PATH')
+
+@app.on_event("startup")
+def warm_up_models():
+    """服务启动时预热BERT模型，避免首个请求承担初始化开销"""
+    warm_up()
+    if SENTENCE_CACHE_PATH and analyzer.bert_analyzer:
+        analyzer.bert_analyzer.load_sentence_cache(SENTENCE_CACHE_PATH)
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await semantic_batcher.close()
+    quota_service.close()
+    if SENTENCE_CACHE_PATH and analyzer.bert_analyzer:
+        analyzer.bert_analyzer.save_sentence_cache(SENTENCE_CACHE_PATH)
 
 # 管理员密钥 - 在实际应用中应该存储在安全的环境变量或配置文件中
 ADMIN_KEY = "bureaucratese_admin_2025"
@@ -63,61 +98,197 @@ def create_user(quota: int = 1000, admin_key: str = Header(None)):
     if admin_key != ADMIN_KEY:
         raise HTTPException(status_code=403, detail="管理员密钥无效")
         
-    user_id = str(uuid.uuid4())
-    api_key = str(uuid.uuid4())
-    
-    conn = sqlite3.connect('bureaucratese.db')
-    c = conn.cursor()
-    c.execute(
-        'INSERT INTO users (id, api_key, quota, created_at) VALUES (?, ?, ?, ?)',
-        (user_id, api_key, quota, datetime.now())
-    )
-    conn.commit()
-    conn.close()
+    return quota_service.create_user(quota)
+
+@app.post("/admin/set_quota")
+def set_quota(api_key: str, quota: int, admin_key: str = Header(None)):
+    """管理员修改用户的配额"""
+    if admin_key != ADMIN_KEY:
+        raise HTTPException(status_code=403, detail="管理员密钥无效")
     
-    return {"user_id": user_id, "api_key": api_key, "quota": quota}
+    if not quota_service.set_quota(api_key, quota):
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return {"api_key": api_key, "quota": quota}
 
 @app.post("/analyze")
-def analyze_text(text: str, method: str = "basic", user: dict = Depends(get_current_user)):
+async def analyze_text(text: str, method: str = "basic", top_k: int = 0, user: dict = Depends(get_current_user)):
     """分析文本的官方话语密度"""
-    # 更新使用次数
-    conn = sqlite3.connect('bureaucratese.db')
-    c = conn.cursor()
-    c.execute('UPDATE users SET used_count = used_count + 1 WHERE api_key = ?', (user["api_key"],))
-    conn.commit()
-    conn.close()
+    # 检查并扣减使用次数
+    remaining_quota = await run_in_threadpool(consume_quota, user["api_key"])
     
     try:
-        result = analyzer.analyze_text(text, method)
+        if method == 'semantic' and top_k <= 0 and analyzer.bert_analyzer:
+            result = await semantic_batcher.submit(text)
+        else:
+            result = await run_in_threadpool(analyzer.analyze_text, text, method, top_k)
         return {
             "result": result,
-            "remaining_quota": user["quota"] - (user["used_count"] + 1)
+            "remaining_quota": remaining_quota
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/analyze/batch")
-def analyze_texts(texts: List[str], method: str = "basic", user: dict = Depends(get_current_user)):
+def analyze_texts(texts: List[str], method: str = "basic", top_k: int = 0, user: dict = Depends(get_current_user)):
     """批量分析多个文本的官方话语密度"""
-    # 更新使用次数（每个文本计数一次）
-    conn = sqlite3.connect('bureaucratese.db')
-    c = conn.cursor()
-    c.execute(
-        'UPDATE users SET used_count = used_count + ? WHERE api_key = ?',
-        (len(texts), user["api_key"])
-    )
-    conn.commit()
-    conn.close()
+    # 检查并扣减使用次数（每个文本计数一次）
+    remaining_quota = consume_quota(user["api_key"], len(texts))
     
     try:
-        results = analyzer.analyze_texts(texts, method)
+        results = analyzer.analyze_texts(texts, method, top_k)
         return {
             "results": results,
-            "remaining_quota": user["quota"] - (user["used_count"] + len(texts))
+            "remaining_quota": remaining_quota
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+class DuplexStreamingResponse(StreamingResponse):
+    """响应体生成器可以继续读取请求体的流式响应
+
+    StreamingResponse在发送响应的同时监听客户端断开，会取走接收通道中的请求体消息。
+    这里只发送响应，客户端断开时读取请求体会抛出ClientDisconnect而结束生成器。
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def _consume_stream(api_key: str, n: int) -> Optional[int]:
+    # 流式分析在次数不足时输出错误行并结束，不抛出异常
+    with metrics.timed('quota'):
+        return quota_service.consume(api_key, n)
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: Request, method: str = "basic", chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE,
+                         user: dict = Depends(get_current_user)):
+    """流式分析NDJSON请求体，按块返回NDJSON结果（每个文本计数一次）
+
+    请求体边接收边分析，每凑齐一块即输出该块的结果，不等待上传完成。
+    """
+    return DuplexStreamingResponse(
+        astream_analysis(request.stream(), analyzer, method, chunk_size,
+                         consume=lambda n: _consume_stream(user["api_key"], n)),
+        media_type="application/x-ndjson"
+    )
+
+# 语料分析任务，由 python -m bureaucratese.jobs 启动的工作进程执行
+job_store = JobStore('bureaucratese.db')
+
+def _job_response(job: dict) -> Dict:
+    job = {key: value for key, value in job.items() if key not in ("api_key", "cancel_requested", "heartbeat")}
+    job["progress"] = job["processed_rows"] / job["total_rows"] if job["total_rows"] else 1.0
+    return job
+
+def _get_user_job(job_id: str, user: dict) -> dict:
+    job = job_store.get(job_id)
+    if job is None or job["api_key"] != user["api_key"]:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+def _prepare_job_input(path, text_column: str, id_column: Optional[str]) -> int:
+    columns = list_columns(path)
+    for column in [text_column] + ([id_column] if id_column else []):
+        if column not in columns:
+            raise ValueError(f"数据集中缺少'{column}'列")
+    return count_rows(path)
+
+# 上传的数据集攒够该大小后在线程池中写入一次磁盘
+UPLOAD_WRITE_SIZE = 1024 * 1024
+
+async def _save_upload(request: Request, path) -> None:
+    """把请求体写入文件，磁盘写入在线程池中执行，不阻塞事件循环"""
+    f = await run_in_threadpool(open, path, "wb")
+    try:
+        buffer = bytearray()
+        async for data in request.stream():
+            buffer += data
+            if len(buffer) >= UPLOAD_WRITE_SIZE:
+                await run_in_threadpool(f.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(f.write, bytes(buffer))
+    finally:
+        await run_in_threadpool(f.close)
+
+@app.post("/jobs")
+async def submit_job(request: Request, file_format: str = "parquet", text_column: str = "text",
+                     methods: str = "basic,weighted", id_column: Optional[str] = None,
+                     user: dict = Depends(get_current_user)):
+    """提交语料分析任务，请求体为数据集文件（每条记录计数一次）"""
+    method_list = [method.strip() for method in methods.split(",") if method.strip()]
+    if file_format not in JOB_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的文件格式: {file_format}")
+    if not method_list or any(method not in JOB_METHODS for method in method_list):
+        raise HTTPException(status_code=400, detail=f"分析方法必须为{', '.join(JOB_METHODS)}之一")
+    if "semantic" in method_list and not analyzer.bert_analyzer:
+        raise HTTPException(status_code=400, detail="BERT分析器未初始化")
+    
+    # 上传的文件直接写入任务目录，不在内存中保留
+    job_id = str(uuid.uuid4())
+    path = job_store.input_path(job_id, file_format)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        await _save_upload(request, path)
+        total_rows = await run_in_threadpool(_prepare_job_input, path, text_column, id_column)
+        await run_in_threadpool(consume_quota, user["api_key"], total_rows)
+    except Exception as e:
+        shutil.rmtree(path.parent, ignore_errors=True)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    job = job_store.create(job_id, user["api_key"], file_format, text_column, method_list, total_rows, id_column)
+    return _job_response(job)
+
+@app.get("/jobs")
+def list_jobs(user: dict = Depends(authenticate)):
+    """列出当前用户的所有任务"""
+    return {"jobs": [_job_response(job) for job in job_store.list_user_jobs(user["api_key"])]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, user: dict = Depends(authenticate)):
+    """查询任务状态和进度，segments为已可下载的结果段数"""
+    job = _job_response(_get_user_job(job_id, user))
+    job["segments"] = len(committed_segments(job_store.output_dir(job_id)))
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str, user: dict = Depends(authenticate)):
+    """取消任务，已完成的结果仍可下载
+
+    提交时扣减的次数中尚未分析的部分会退还：排队中的任务立即退还全部记录数，
+    运行中的任务由工作进程在当前批结束、停止执行后退还。
+    """
+    job = _get_user_job(job_id, user)
+    if job_store.request_cancel(job_id):
+        quota_service.refund(user["api_key"], job["total_rows"])
+    return _job_response(job_store.get(job_id))
+
+@app.get("/jobs/{job_id}/segments/{segment}")
+def download_job_segment(job_id: str, segment: int, user: dict = Depends(authenticate)):
+    """下载一个parquet格式的结果段，任务运行中即可下载已完成的段"""
+    _get_user_job(job_id, user)
+    segments = committed_segments(job_store.output_dir(job_id))
+    if not 0 <= segment < len(segments):
+        raise HTTPException(status_code=404, detail="结果段不存在")
+    return FileResponse(segments[segment], media_type="application/octet-stream",
+                        filename=f"{job_id}-{segments[segment].name}")
+
+def _iter_job_results(paths):
+    import pandas as pd
+    for path in paths:
+        df = pd.read_parquet(path).reset_index().rename(columns={"index": "id"})
+        yield df.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n").encode("utf-8") + b"\n"
+
+@app.get("/jobs/{job_id}/results")
+def download_job_results(job_id: str, user: dict = Depends(authenticate)):
+    """以NDJSON格式流式返回全部已完成的结果，每次只读取一个结果段"""
+    _get_user_job(job_id, user)
+    paths = committed_segments(job_store.output_dir(job_id))
+    return StreamingResponse(_iter_job_results(paths), media_type="application/x-ndjson")
+
 @app.get("/quota")
 def get_quota(user: dict = Depends(get_current_user)):
     """查询剩余API调用次数"""
@@ -125,4 +296,53 @@ def get_quota(user: dict = Depends(get_current_user)):
         "quota": user["quota"],
         "used_count": user["used_count"],
         "remaining_quota": user["quota"] - user["used_count"]
-    }
\ No newline at end of file
+    }
+
+def _model_parameter_bytes() -> Optional[int]:
+    bert_analyzer = analyzer.bert_analyzer
+    if not bert_analyzer:
+        return None
+    return sum(p.numel() * p.element_size() for p in bert_analyzer.model.parameters())
+
+def _official_embeddings_bytes() -> Optional[int]:
+    bert_analyzer = analyzer.bert_analyzer
+    return bert_analyzer.official_embeddings.nbytes if bert_analyzer else None
+
+def _result_cache_lookups():
+    stats = analyzer.cache_stats()
+    if "misses" not in stats:
+        return None
+    return [({"result": "memory_hit"}, stats["memory_hits"]),
+            ({"result": "disk_hit"}, stats["disk_hits"]),
+            ({"result": "miss"}, stats["misses"])]
+
+def _sentence_cache_lookups():
+    if not analyzer.bert_analyzer:
+        return None
+    stats = analyzer.bert_analyzer.sentence_cache.stats()
+    return [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]
+
+metrics.REGISTRY.callback("bureaucratese_result_cache_lookups_total", "结果缓存的查询次数",
+                          _result_cache_lookups, labelnames=("result",), type="counter")
+metrics.REGISTRY.callback("bureaucratese_result_cache_size", "结果缓存内存层的条目数",
+                          lambda: analyzer.cache_stats().get("memory_size"))
+metrics.REGISTRY.callback("bureaucratese_sentence_cache_lookups_total", "句子向量缓存的查询次数",
+                          _sentence_cache_lookups, labelnames=("result",), type="counter")
+metrics.REGISTRY.callback("bureaucratese_sentence_cache_size", "句子向量缓存的句子数",
+                          lambda: len(analyzer.bert_analyzer.sentence_cache) if analyzer.bert_analyzer else None)
+metrics.REGISTRY.callback("bureaucratese_micro_batch_queue_depth", "等待合并推理的语义分析请求数",
+                          semantic_batcher.queue_depth)
+metrics.REGISTRY.callback("bureaucratese_jobs", "各状态的语料分析任务数",
+                          lambda: [({"status": status}, count) for status, count in job_store.count_by_status().items()],
+                          labelnames=("status",))
+metrics.REGISTRY.callback("bureaucratese_model_parameter_bytes", "BERT模型参数占用的字节数",
+                          _model_parameter_bytes)
+metrics.REGISTRY.callback("bureaucratese_official_embeddings_bytes", "官方话语词向量矩阵的字节数（内存映射，各进程共享）",
+                          _official_embeddings_bytes)
+metrics.REGISTRY.callback("bureaucratese_process_resident_memory_bytes", "进程的常驻内存字节数",
+                          metrics.process_memory)
+
+@app.get("/metrics")
+def get_metrics():
+    """以Prometheus文本格式输出运行指标"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
@@ -17,6 +17,9 @@ setup(
         'numpy>=1.19.0',
         'tqdm>=4.45.0'
     ],
+    extras_require={
+        'onnx': ['onnx>=1.9.0', 'onnxruntime>=1.8.0']
+    },
     author="Adrian",
     author_email="",
     description="A Python package for analyzing the density of Chinese official discourse in text",
@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+from bureaucratese.checkpoint import CheckpointStore
+
+
+@pytest.mark.parametrize('index', [
+    pd.Index(['a', 'b', 'c', 'd']),
+    pd.Index([0.5, 1.5, 2.5, 3.5]),
+    pd.date_range('2024-01-01', periods=4, freq='D'),
+    pd.Index([10, 11, 12, 20]),
+])
+def test_resume_skips_committed_ids(tmp_path, index):
+    df = pd.DataFrame({'density': [0.1, 0.2, 0.3, 0.4]}, index=index)
+    CheckpointStore(tmp_path).write_segment(df.iloc[:2])
+
+    # 重新打开检查点，模拟崩溃后恢复
+    store = CheckpointStore(tmp_path)
+    remaining = df[~df.index.isin(store.completed_ids())]
+    assert list(remaining.index) == list(index[2:])
+
+    store.write_segment(remaining)
+    result = store.read()
+    assert len(result) == len(df)
+    assert not result.index.duplicated().any()
@@ -0,0 +1,71 @@
+import pytest
+
+from bureaucratese.jobs import JobStore
+from bureaucratese.quota import QuotaService
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'), str(tmp_path / 'jobs'))
+
+
+def _create(store, job_id='job-1', total_rows=10):
+    return store.create(job_id, 'key', 'jsonl', 'text', ['basic'], total_rows)
+
+
+def test_claim_returns_lease_and_skips_running_jobs(store):
+    _create(store)
+    job = store.claim('w1')
+    assert job['status'] == 'running'
+    assert job['worker'].startswith('w1:')
+    # 心跳未过期的运行中任务不会被再次领取
+    assert store.claim('w2') is None
+
+
+def test_stale_lease_cannot_heartbeat_or_finish(store):
+    _create(store)
+    first = store.claim('w1')['worker']
+    assert store.heartbeat('job-1', 3, first)
+
+    # 心跳超时后被其他工作进程重新领取，原租约失效
+    second = store.claim('w2', stale_after=-1)['worker']
+    assert second != first
+    assert not store.heartbeat('job-1', 5, first)
+    assert not store.finish('job-1', 'completed', first)
+    assert store.get('job-1')['status'] == 'running'
+    assert store.get('job-1')['processed_rows'] == 3
+
+    assert store.heartbeat('job-1', 10, second)
+    assert store.finish('job-1', 'completed', second)
+    job = store.get('job-1')
+    assert (job['status'], job['processed_rows']) == ('completed', 10)
+    # 已结束的任务不能再次记录状态
+    assert not store.finish('job-1', 'failed', second)
+
+
+def test_request_cancel_reports_immediate_cancel_once(store):
+    _create(store, 'queued')
+    assert store.request_cancel('queued')
+    assert store.get('queued')['status'] == 'cancelled'
+    assert not store.request_cancel('queued')
+
+    _create(store, 'running')
+    lease = store.claim('w1')['worker']
+    assert not store.request_cancel('running')
+    assert store.is_cancel_requested('running')
+    assert store.finish('running', 'cancelled', lease)
+
+
+def test_refund_of_cancelled_rows(store):
+    quota_service = QuotaService(store.db_path)
+    api_key = quota_service.create_user(10)['api_key']
+    assert quota_service.consume(api_key, 10) == 0
+
+    store.create('job-1', api_key, 'jsonl', 'text', ['basic'], 10)
+    lease = store.claim('w1')['worker']
+    store.heartbeat('job-1', 6, lease)
+    assert store.finish('job-1', 'cancelled', lease)
+    job = store.get('job-1')
+    quota_service.refund(job['api_key'], job['total_rows'] - job['processed_rows'])
+
+    assert quota_service.get_user(api_key, use_cache=False)['used_count'] == 6
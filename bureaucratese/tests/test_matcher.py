@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from bureaucratese.matcher import OfficialWordMatcher
+
+
+def _reference_find(words, text):
+    """逐个位置取最长匹配的朴素实现，作为自动机结果的对照"""
+    words = {word for word in words if word}
+    longest = max(map(len, words), default=0)
+    matches = []
+    position = 0
+    while position < len(text):
+        for length in range(min(longest, len(text) - position), 0, -1):
+            if text[position:position + length] in words:
+                matches.append(text[position:position + length])
+                position += length
+                break
+        else:
+            position += 1
+    return matches
+
+
+@pytest.mark.parametrize('words, text, expected', [
+    # 同一起点取最长的词
+    (['中国', '中国人民', '人民', '人民银行'], '中国人民银行', ['中国人民']),
+    # 最左优先，重叠的后一个词被跳过
+    (['全面', '面深化改革'], '全面深化改革', ['全面']),
+    (['深化改革', '改革开放'], '全面深化改革开放', ['深化改革']),
+    # 失败转移：abc之后不是d，仍能找到bc
+    (['abcd', 'bc'], 'abce', ['bc']),
+    # 较长的候选失败后回到较短的后缀词
+    (['改革', '深化改革开放'], '深化改革推进', ['改革']),
+    (['改革'], '改革改革，改革', ['改革', '改革', '改革']),
+    (['改革'], '发展', []),
+])
+def test_leftmost_longest_non_overlapping(words, text, expected):
+    assert OfficialWordMatcher(words).find(text) == expected
+
+
+def test_ignores_empty_and_non_string_words():
+    matcher = OfficialWordMatcher(['', None, float('nan'), '发展'])
+    assert matcher.find('科学发展') == ['发展']
+    assert OfficialWordMatcher([]).find('科学发展') == []
+
+
+def test_matches_reference_on_random_text():
+    rng = random.Random(0)
+    for _ in range(200):
+        words = [''.join(rng.choice('abc') for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 40)))
+        assert OfficialWordMatcher(words).find(text) == _reference_find(words, text), (words, text)
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from bureaucratese.quota import QuotaService
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_concurrent_consume_never_overspends(tmp_path, write_behind):
+    db_path = str(tmp_path / 'quota.db')
+    service = QuotaService(db_path, write_behind=write_behind, flush_interval=0.01)
+    api_key = service.create_user(100)['api_key']
+
+    successes = []
+    start = threading.Barrier(8)
+
+    def worker():
+        start.wait()
+        for _ in range(50):
+            if service.consume(api_key) is not None:
+                successes.append(1)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    service.close()
+
+    assert len(successes) == 100
+    # 写回模式关闭时已把剩余次数写入数据库
+    user = QuotaService(db_path).get_user(api_key, use_cache=False)
+    assert user['used_count'] == 100
+
+
+def test_consume_rejects_without_charging(tmp_path):
+    service = QuotaService(str(tmp_path / 'quota.db'))
+    api_key = service.create_user(5)['api_key']
+
+    assert service.consume(api_key, 3) == 2
+    assert service.consume(api_key, 3) is None
+    assert service.get_user(api_key, use_cache=False)['used_count'] == 3
+    assert service.consume('no-such-key') is None
+
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+@pytest.mark.parametrize('flush_first', [False, True])
+def test_refund_restores_quota(tmp_path, write_behind, flush_first):
+    db_path = str(tmp_path / 'quota.db')
+    service = QuotaService(db_path, write_behind=write_behind)
+    api_key = service.create_user(10)['api_key']
+
+    assert service.consume(api_key, 10) == 0
+    if flush_first:
+        service.flush()
+    service.refund(api_key, 4)
+    assert service.consume(api_key, 4) == 0
+    assert service.consume(api_key) is None
+    service.close()
+
+    assert QuotaService(db_path).get_user(api_key, use_cache=False)['used_count'] == 10
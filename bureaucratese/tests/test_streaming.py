@@ -0,0 +1,97 @@
+import io
+import json
+import asyncio
+
+import pytest
+
+from bureaucratese.streaming import _parse_line, iter_ndjson_chunks, aiter_ndjson_chunks, stream_analysis
+
+NDJSON = (
+    '"第一条"\n'
+    '\n'
+    '{"id": 7, "text": "第二条"}\n'
+    '{"id": 8}\n'
+    '{not json\n'
+    '   \n'
+    '["列表"]\n'
+    '"最后一条没有换行"'
+).encode('utf-8')
+
+
+@pytest.mark.parametrize('line', [b'', b'\n', b'  \r\n'])
+def test_parse_line_skips_blank_lines(line):
+    assert _parse_line(1, line) is None
+
+
+@pytest.mark.parametrize('line, expected', [
+    ('"文本"\n', (3, None, '文本', None)),
+    ('{"id": "a", "text": "文本"}', (3, 'a', '文本', None)),
+    ('{"text": "文本"}', (3, None, '文本', None)),
+])
+def test_parse_line_valid_rows(line, expected):
+    assert _parse_line(3, line.encode('utf-8')) == expected
+
+
+@pytest.mark.parametrize('line', [b'{not json', b'123', b'["x"]', b'{"id": 1}', b'{"text": 5}', b'\xff\xfe'])
+def test_parse_line_error_rows(line):
+    line_number, record_id, text, error = _parse_line(4, line)
+    assert (line_number, record_id, text) == (4, None, None)
+    assert error
+
+
+def test_parse_line_reports_invalid_record_shape():
+    assert _parse_line(1, b'{"id": 1}')[3] == '每行必须是字符串或包含text字段的对象'
+
+
+def _flatten(chunks):
+    return [item for chunk in chunks for item in chunk]
+
+
+def test_iter_ndjson_chunks_keeps_line_numbers_and_errors():
+    chunks = list(iter_ndjson_chunks(io.BytesIO(NDJSON), chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2]
+
+    items = _flatten(chunks)
+    assert [item[0] for item in items] == [1, 3, 4, 5, 7, 8]
+    assert [item[2] for item in items] == ['第一条', '第二条', None, None, None, '最后一条没有换行']
+    assert items[1][1] == 7
+    assert [item[3] is not None for item in items] == [False, False, True, True, True, False]
+
+
+@pytest.mark.parametrize('piece_size', [1, 3, 7, len(NDJSON)])
+def test_aiter_ndjson_chunks_matches_sync_reader(piece_size):
+    async def pieces():
+        # 按任意字节边界切分，可能切在多字节字符中间
+        for start in range(0, len(NDJSON), piece_size):
+            yield NDJSON[start:start + piece_size]
+
+    async def collect():
+        return [chunk async for chunk in aiter_ndjson_chunks(pieces(), chunk_size=2)]
+
+    expected = list(iter_ndjson_chunks(io.BytesIO(NDJSON), chunk_size=2))
+    assert asyncio.run(collect()) == expected
+
+
+class _EchoAnalyzer:
+    def analyze_texts(self, texts, method):
+        return [{'length': len(text), 'method': method} for text in texts]
+
+
+def test_stream_analysis_stops_when_quota_runs_out():
+    consumed = []
+
+    def consume(n):
+        if sum(consumed) + n > 2:
+            return None
+        consumed.append(n)
+        return 2 - sum(consumed)
+
+    f = io.BytesIO(b'"a"\n"bb"\n"ccc"\n"dddd"\n')
+    rows = [json.loads(line) for line in stream_analysis(f, _EchoAnalyzer(), chunk_size=2, consume=consume)]
+
+    assert rows[0] == {'line': 1, 'id': None, 'result': {'length': 1, 'method': 'basic'}}
+    assert rows[1]['result']['length'] == 2
+    assert rows[2] == {'line': 3, 'error': 'API调用次数已达上限'}
+    assert len(rows) == 3
+    assert consumed == [2]
+    assert f.closed
@@ -0,0 +1,33 @@
+# Gunicorn配置文件
+#
+# 启用preload_app后，BERT模型和词向量在主进程中加载一次，
+# 工作进程通过fork以写时复制的方式共享这部分内存，
+# 官方话语词向量本身以只读内存映射方式打开，也只占用一份页缓存。
+import gc
+import os
+
+bind = os.environ.get('BUREAUCRATESE_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WORKERS', 4))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# 在主进程中导入应用（加载模型），再fork出工作进程
+preload_app = True
+
+
+def on_starting(server):
+    """清除上次运行留下的各工作进程指标快照"""
+    from bureaucratese.metrics import clear_multiprocess_dir
+    clear_multiprocess_dir()
+
+
+def when_ready(server):
+    """模型加载完成后冻结现有对象，避免垃圾回收写入对象头导致共享内存页被复制"""
+    if hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """按工作进程数分配PyTorch计算线程，避免多个进程争抢CPU"""
+    from bureaucratese.parallel import set_worker_threads
+    set_worker_threads(server.cfg.workers)